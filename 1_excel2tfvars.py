@@ -1,29 +1,61 @@
+import argparse
+import contextlib
+import io
 import sys
 import os
+import re
 import openpyxl
 from openpyxl import load_workbook
 from dotenv import load_dotenv  # .envを読み込むためのライブラリ
+from sheet_extent import iter_until_trailing_blanks
 load_dotenv()  # .envを読み込み
 
 SHEET_PREFIXES = os.getenv("1_SHEET_NAME_PREFIXES", "")  # .envからシート名のプレフィックスを取得
 
-def read_excel(file_path):
-    valid_extensions = [".xlsx", ".xlsm", ".xltx", ".xltm"]
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext not in valid_extensions:
-        raise ValueError(f"Unsupported file format: {ext}; please use xlsx, xlsm, xltx, or xltm.")
+# tfvarsの変数定義の開始行（インデントなしの「変数名 = 」）
+VARIABLE_START_RE = re.compile(r"^([A-Za-z_][A-Za-z0-9_-]*) = ")
 
-    wb = load_workbook(file_path)
+def fill_color(row):
+    # 行のA列(変数名)の塗りつぶし色を返す（塗りつぶしなしは"00000000"）
+    fill = row[0].fill if row else None
+    return fill.start_color.index if fill else "00000000"
+
+def read_excel(file_path, sheet_names=None, var_names=None):
+    # file_pathにはパスのほか、ワークブックのバイト列やファイルオブジェクトも指定できる
+    if isinstance(file_path, (bytes, bytearray)):
+        file_path = io.BytesIO(file_path)
+    if isinstance(file_path, str):
+        valid_extensions = [".xlsx", ".xlsm", ".xltx", ".xltm"]
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in valid_extensions:
+            raise ValueError(f"Unsupported file format: {ext}; please use xlsx, xlsm, xltx, or xltm.")
+
+    # read_onlyモードでは読み込んだシートだけが解析される
+    wb = load_workbook(file_path, read_only=True)
     sheets_data = {}
     for sheet_name in wb.sheetnames:
-        # シート名が指定したプレフィックスで始まるかチェック
-        if sheet_name.startswith(SHEET_PREFIXES):
-            sheet = wb[sheet_name]
-            # values_only=Trueだとセルオブジェクトが得られないので、シートはそのまま保持
-            data = []
-            for row in sheet.iter_rows(min_row=3, values_only=True):
-                data.append(row)
-            sheets_data[sheet_name] = (data, sheet)
+        # シート名の指定があればそれを優先し、なければプレフィックスで判定
+        if sheet_names is not None:
+            if sheet_name not in sheet_names:
+                continue
+        elif not sheet_name.startswith(SHEET_PREFIXES):
+            continue
+        sheet = wb[sheet_name]
+        # 値とA列(変数名)の塗りつぶし色を行ごとに保持
+        data = []
+        fill_colors = []
+        # A〜F列だけを読み、末尾の空行（書式だけが設定された行など）は読み飛ばす
+        # 途中の空行はA列の塗りつぶし色が同じであれば同じ行として扱う
+        for _, row in iter_until_trailing_blanks(
+            sheet.iter_rows(min_row=3, max_col=6), 3, blank_key=fill_color
+        ):
+            values = tuple(cell.value for cell in row)
+            if var_names is not None and (not values or values[0] not in var_names):
+                continue
+            data.append(values)
+            fill_colors.append(fill_color(row))
+        sheets_data[sheet_name] = (data, fill_colors)
+    wb.close()
     return sheets_data
 
 def validate_value(value, value_type, max_length_or_limit, allow_empty):
@@ -49,89 +81,169 @@ def validate_value(value, value_type, max_length_or_limit, allow_empty):
             raise ValueError("Boolean value must be 'true' or 'false'")
     return value
 
+def convert_excel(source, output=None, sheet_names=None, var_names=None):
+    # ワークブック(パス・バイト列・ファイルオブジェクト)をTFVARSに変換する関数
+    # outputにテキストストリームを指定した場合はそこへ書き出し、省略時は文字列で返す
+    sheets_data = read_excel(source, sheet_names, var_names)
+    if not sheets_data:
+        if sheet_names is not None:
+            raise ValueError(f"No sheets found: {', '.join(sheet_names)}")
+        raise ValueError(f"No sheets found starting with prefix: {SHEET_PREFIXES}")
+    if output is not None:
+        write_tfvars(sheets_data, output)
+        return None
+    buffer = io.StringIO()
+    write_tfvars(sheets_data, buffer)
+    return buffer.getvalue()
+
 def generate_tfvars(sheets_data, output_file):
     # TFVARSファイルを書き出す関数
     with open(output_file, "w", encoding="utf-8", newline="\n") as f:
-        for sheet_name, (data, sheet) in sheets_data.items():
-            for index, row in enumerate(data):
-                # シートのA列(変数名)を取得
-                cell = sheet[f"A{index + 3}"]
-                # 色なしのセルだけを処理
-                if cell.fill.start_color.index == "00000000":
-                    var_name = row[0]
-                    var_type = row[1]
-                    max_length_or_limit = row[2]
-                    allow_empty = row[3]
-                    value = row[5]
-                    # 値が空の場合はそのままにしてvalidate_valueへ渡す
-                    try:
-                        validated_value = validate_value(
-                            value, var_type, max_length_or_limit, allow_empty
-                        )
-                    except ValueError as e:
-                        # エラー時は終了
-                        print(f"Error validating value for {var_name}: {e}")
-                        sys.exit(1)
-                
-                    # 空白の場合の出力をシンプルに
-                    if not validated_value:
-                        # string/number/boolの場合はnullにする
-                        if var_type in ["string", "number", "bool"]:
-                            f.write(f"{var_name} = null\n")
-                        elif var_type == "list":
-                            f.write(f"{var_name} = []\n")
-                        elif var_type == "map":
-                            f.write(f"{var_name} = {{}}\n")
-                        else:
-                            f.write(f"{var_name} = null\n")
+        write_tfvars(sheets_data, f)
+
+def write_tfvars(sheets_data, f):
+    # TFVARSの内容をファイルオブジェクトへ書き出す関数
+    for sheet_name, (data, fill_colors) in sheets_data.items():
+        for row, fill_color in zip(data, fill_colors):
+            # 色なしのセルだけを処理
+            if fill_color == "00000000":
+                var_name = row[0]
+                var_type = row[1]
+                max_length_or_limit = row[2]
+                allow_empty = row[3]
+                value = row[5]
+                # 値が空の場合はそのままにしてvalidate_valueへ渡す
+                try:
+                    validated_value = validate_value(
+                        value, var_type, max_length_or_limit, allow_empty
+                    )
+                except ValueError as e:
+                    # エラー時は終了
+                    print(f"Error validating value for {var_name}: {e}")
+                    sys.exit(1)
+
+                # 空白の場合の出力をシンプルに
+                if not validated_value:
+                    # string/number/boolの場合はnullにする
+                    if var_type in ["string", "number", "bool"]:
+                        f.write(f"{var_name} = null\n")
+                    elif var_type == "list":
+                        f.write(f"{var_name} = []\n")
+                    elif var_type == "map":
+                        f.write(f"{var_name} = {{}}\n")
+                    else:
+                        f.write(f"{var_name} = null\n")
+                else:
+                    # 各Terraform型ごとに書き出し
+                    if var_type == "string":
+                        f.write(f'{var_name} = "{validated_value}"\n')
+                    elif var_type == "list":
+                        values = validated_value.split("\n")
+                        f.write(f"{var_name} = [\n")
+                        for i, val in enumerate(values):
+                            # 最後の要素にカンマを付与しない
+                            if i < len(values) - 1:
+                                f.write(f'    "{val}",\n')
+                            else:
+                                f.write(f'    "{val}"\n')
+                        f.write("]\n")
+                    elif var_type == "map":
+                        values = validated_value.split("\n")
+                        f.write(f"{var_name} = {{\n")
+                        for i, val in enumerate(values):
+                            key_values = val.split(":")
+                            f.write(f'    "key{i+1:03d}" = {{\n')
+                            for j, kv in enumerate(key_values):
+                                f.write(f'        "value{j+1:03d}" = "{kv}",\n')
+                            f.write("    },\n")
+                        f.write("}\n")
+                    elif var_type == "number":
+                        f.write(f"{var_name} = {validated_value}\n")
+                    elif var_type == "bool":
+                        # boolは小文字にして書き出す
+                        f.write(f"{var_name} = {str(validated_value).strip().lower()}\n")
                     else:
-                        # 各Terraform型ごとに書き出し
-                        if var_type == "string":
-                            f.write(f'{var_name} = "{validated_value}"\n')
-                        elif var_type == "list":
-                            values = validated_value.split("\n")
-                            f.write(f"{var_name} = [\n")
-                            for i, val in enumerate(values):
-                                # 最後の要素にカンマを付与しない
-                                if i < len(values) - 1:
-                                    f.write(f'    "{val}",\n')
-                                else:
-                                    f.write(f'    "{val}"\n')
-                            f.write("]\n")
-                        elif var_type == "map":
-                            values = validated_value.split("\n")
-                            f.write(f"{var_name} = {{\n")
-                            for i, val in enumerate(values):
-                                key_values = val.split(":")
-                                f.write(f'    "key{i+1:03d}" = {{\n')
-                                for j, kv in enumerate(key_values):
-                                    f.write(f'        "value{j+1:03d}" = "{kv}",\n')
-                                f.write("    },\n")
-                            f.write("}\n")
-                        elif var_type == "number":
-                            f.write(f"{var_name} = {validated_value}\n")
-                        elif var_type == "bool":
-                            # boolは小文字にして書き出す
-                            f.write(f"{var_name} = {str(validated_value).strip().lower()}\n")
-                        else:
-                            f.write(f"{var_name} = null\n")
+                        f.write(f"{var_name} = null\n")
+
+def split_variables(lines):
+    # tfvarsの行を(変数名, 行リスト)に分割する関数（変数定義以外の行は変数名None）
+    statements = []
+    for line in lines:
+        match = VARIABLE_START_RE.match(line)
+        if match:
+            statements.append((match.group(1), [line]))
+        elif statements:
+            statements[-1][1].append(line)
+        else:
+            statements.append((None, [line]))
+    return statements
+
+def merge_tfvars(sheets_data, output_file):
+    # 部分変換の結果を既存のTFVARSファイルにマージする関数
+    buffer = io.StringIO()
+    write_tfvars(sheets_data, buffer)
+    new_statements = dict(split_variables(buffer.getvalue().splitlines()))
+
+    lines = []
+    if os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+    # 既存の変数は位置を保ったまま置き換え、新しい変数は末尾に追加
+    merged = []
+    for name, statement_lines in split_variables(lines):
+        if name in new_statements:
+            merged.extend(new_statements.pop(name))
+        else:
+            merged.extend(statement_lines)
+    for statement_lines in new_statements.values():
+        merged.extend(statement_lines)
+
+    with open(output_file, "w", encoding="utf-8", newline="\n") as f:
+        f.write("".join(f"{line}\n" for line in merged))
 
 if __name__ == "__main__":
     # コマンドライン引数チェック
-    if len(sys.argv) != 2:
-        print("Usage: python excel2tfvars.py <excel_filepath>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(usage="python excel2tfvars.py <excel_filepath> [--sheets SHEETS] [--keys KEYS] [--output OUTPUT]")
+    parser.add_argument("excel_filepath", help="Excelファイルのパス（-で標準入力）")
+    parser.add_argument("--sheets", help="変換するシート名（カンマ区切り）。指定時は1_SHEET_NAME_PREFIXESより優先")
+    parser.add_argument("--keys", help="変換する変数名（カンマ区切り）。既存の出力ファイルの該当変数を置き換える")
+    parser.add_argument("-o", "--output", help="出力するtfvarsファイルのパス（-で標準出力、標準入力から読む場合の既定）")
+    args = parser.parse_args()
 
-    excel_file_path = sys.argv[1]
+    excel_file_path = args.excel_filepath
+    sheet_names = [s.strip() for s in args.sheets.split(",")] if args.sheets else None
+    var_names = {k.strip() for k in args.keys.split(",")} if args.keys else None
 
-    # Excelファイル名からフォルダ名を作成
-    excel_file_name = os.path.splitext(os.path.basename(excel_file_path))[0]
-    output_folder = os.path.join("output", excel_file_name)
-    os.makedirs(output_folder, exist_ok=True)
-    output_tfvars_file = os.path.join(output_folder, "terraform.tfvars")
+    if args.output:
+        output_tfvars_file = args.output
+    elif excel_file_path == "-":
+        output_tfvars_file = "-"
+    else:
+        # Excelファイル名からフォルダ名を作成
+        excel_file_name = os.path.splitext(os.path.basename(excel_file_path))[0]
+        output_folder = os.path.join("output", excel_file_name)
+        os.makedirs(output_folder, exist_ok=True)
+        output_tfvars_file = os.path.join(output_folder, "terraform.tfvars")
 
-    sheets_data = read_excel(excel_file_path)
-    if not sheets_data:
-        print(f"No sheets found starting with prefix: {SHEET_PREFIXES}")
-        sys.exit(1)
-    generate_tfvars(sheets_data, output_tfvars_file)
+    source = sys.stdin.buffer.read() if excel_file_path == "-" else excel_file_path
+    to_stdout = output_tfvars_file == "-"
+    # 標準出力に書き出す場合、メッセージは標準エラー出力へ回す
+    with contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext():
+        sheets_data = read_excel(source, sheet_names, var_names)
+        if not sheets_data:
+            if sheet_names is not None:
+                print(f"No sheets found: {', '.join(sheet_names)}")
+            else:
+                print(f"No sheets found starting with prefix: {SHEET_PREFIXES}")
+            sys.exit(1)
+        if to_stdout:
+            buffer = io.StringIO()
+            write_tfvars(sheets_data, buffer)
+        # シート・変数名を指定した部分変換は既存の出力ファイルにマージする
+        elif sheet_names is not None or var_names is not None:
+            merge_tfvars(sheets_data, output_tfvars_file)
+        else:
+            generate_tfvars(sheets_data, output_tfvars_file)
+    if to_stdout:
+        sys.stdout.buffer.write(buffer.getvalue().encode("utf-8"))
@@ -1,3 +1,6 @@
+import argparse
+import contextlib
+import io
 import json
 import openpyxl
 import sys
@@ -7,13 +10,18 @@ import re
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 from dotenv import load_dotenv
+from sheet_extent import last_data_row
 
 load_dotenv()  # 環境変数を読み込み
 
 # tfvarsファイルを読み込む関数
 def load_tfvars(filepath):
     with open(filepath, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
+        return parse_tfvars(file.read())
+
+# tfvarsの文字列を解析する関数
+def parse_tfvars(text):
+    lines = text.splitlines()
     tfvars = {}
     current_key = None
     current_value = []
@@ -80,28 +88,83 @@ def should_skip(item):
         return True
     return False
 
-# Excelファイルを更新する関数
-def update_excel(tfvars, excel_filepath):
+# Excelファイルを更新する関数（変更内容のリストを返す）
+def update_excel(tfvars, excel_filepath, open_excel=True, dry_run=False):
     if not excel_filepath.endswith('.xlsx'):
         raise ValueError("Only .xlsx files are supported")
     wb = load_workbook(excel_filepath)
+    changes = apply_tfvars(tfvars, wb)
+
+    # dry-runの場合は変更内容の表示だけを行う
+    if dry_run:
+        return changes
+
+    # Excelファイルを保存（変更がなければ保存しない）
+    if changes:
+        wb.save(excel_filepath)
+    else:
+        print("No changes; skipped saving")
+
+    # Excelファイルを開く
+    if open_excel:
+        os.system(f'start excel "{excel_filepath}"')
+    return changes
+
+# ワークブック(パス・バイト列・ファイルオブジェクト)にtfvarsを反映する関数
+# tfvarsは辞書またはtfvarsの文字列。outputにバイナリストリームを指定した場合は
+# そこへ保存し、省略時は更新後のワークブックをバイト列で返す
+# dry_runの場合は変更内容の表示だけを行い、Noneを返す
+def update_workbook(tfvars, source, output=None, dry_run=False):
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if isinstance(tfvars, str):
+        tfvars = parse_tfvars(tfvars)
+    wb = load_workbook(source)
+    apply_tfvars(tfvars, wb)
+    if dry_run:
+        return None
+    if output is not None:
+        wb.save(output)
+        return None
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+def same_cell_value(old, new):
+    # 空セルと空文字、数値セルと同じ表記の文字列は同じ値として扱う
+    if old is None or old == '':
+        return new is None or new == ''
+    return old == new or (not isinstance(old, bool) and str(old) == new)
+
+# 読み込み済みのワークブックにtfvarsの値を反映する関数
+# 値が変わるセルだけを書き換え、(変数名, 列名, 変更前, 変更後)のリストを返す
+def apply_tfvars(tfvars, wb):
     ws = wb["ヒアリングシート"]
+    changes = []
+
+    def set_cell(key, label, cell, value):
+        if same_cell_value(cell.value, value):
+            return
+        changes.append((key, label, cell.value, value))
+        cell.value = value
 
     unmatched_keys = set(tfvars.keys())
+    # 書式だけが設定された末尾の行は対象外とする
+    max_row = last_data_row(ws, 2, 6)
 
     excel_items = []
-    for row in ws.iter_rows(min_row=2, max_col=6, max_row=ws.max_row):
+    for row in ws.iter_rows(min_row=2, max_col=6, max_row=max_row):
         a_value = row[0].value
         fill = row[0].fill
         if a_value in tfvars and (fill is None or fill == PatternFill()):
             formatted_value = format_tfvars_value(tfvars[a_value])
-            row[5].value = formatted_value
-            row[1].value = determine_type(tfvars[a_value])
+            set_cell(a_value, 'value', row[5], formatted_value)
+            set_cell(a_value, 'type', row[1], determine_type(tfvars[a_value]))
             if formatted_value == '':
-                row[3].value = 'false'
+                set_cell(a_value, 'allow_empty', row[3], 'false')
             unmatched_keys.discard(a_value)
 
-    for row in ws.iter_rows(min_row=2, max_col=1, max_row=ws.max_row):
+    for row in ws.iter_rows(min_row=2, max_col=1, max_row=max_row):
         if row[0].value:
             excel_items.append(row[0].value)
 
@@ -121,24 +184,52 @@ def update_excel(tfvars, excel_filepath):
         for key in excel_only_filtered:
             print(key)
 
-    # Excelファイルを保存
-    wb.save(excel_filepath)
+    if changes:
+        print("-----changes:")
+        for key, label, old, new in changes:
+            print(f"{key} [{label}]: {json.dumps(old, ensure_ascii=False, default=str)} -> {json.dumps(new, ensure_ascii=False)}")
 
-    # Excelファイルを開く
-    os.system(f'start excel "{excel_filepath}"')
+    return changes
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python tfvars2excel.py <excel_filepath> <tfvars_filepath>")
+    parser = argparse.ArgumentParser(usage="python tfvars2excel.py <excel_filepath> [<tfvars_filepath>] [--output OUTPUT] [--no-open] [--dry-run]")
+    parser.add_argument("excel_filepath", help="更新するExcelファイルのパス（-で標準入力）")
+    parser.add_argument("tfvars_filepath", nargs="?", help="tfvarsファイルのパス（-で標準入力）")
+    parser.add_argument("-o", "--output", help="保存先のExcelファイルのパス（-で標準出力、既定は元のファイルを上書き）")
+    parser.add_argument("--no-open", action="store_true", help="更新後にExcelを開かない")
+    parser.add_argument("--dry-run", action="store_true", help="変更内容を表示するだけで保存しない")
+    args = parser.parse_args()
+
+    excel_filepath = args.excel_filepath
+    if excel_filepath == "-" and args.tfvars_filepath in (None, "-"):
+        print("tfvars_filepath is required when reading the Excel file from stdin")
         sys.exit(1)
 
-    excel_filepath = sys.argv[1]
-    
     filename = os.path.splitext(os.path.basename(excel_filepath))[0]
-    if sys.argv[2]:
-        tfvars_filepath = sys.argv[2]
+    if args.tfvars_filepath:
+        tfvars_filepath = args.tfvars_filepath
     else:
         tfvars_filepath = f"./output/{filename}/terraform.tfvars"
 
-    tfvars = load_tfvars(tfvars_filepath)
-    update_excel(tfvars, excel_filepath)
+    if tfvars_filepath == "-":
+        tfvars = parse_tfvars(sys.stdin.read())
+    else:
+        tfvars = load_tfvars(tfvars_filepath)
+
+    output = args.output or ("-" if excel_filepath == "-" else None)
+    if output is None:
+        update_excel(tfvars, excel_filepath, open_excel=not args.no_open, dry_run=args.dry_run)
+    else:
+        source = sys.stdin.buffer.read() if excel_filepath == "-" else excel_filepath
+        # 標準出力に書き出す場合、メッセージは標準エラー出力へ回す
+        with contextlib.redirect_stdout(sys.stderr) if output == "-" else contextlib.nullcontext():
+            workbook = update_workbook(tfvars, source, dry_run=args.dry_run)
+        if workbook is None:
+            pass
+        elif output == "-":
+            sys.stdout.buffer.write(workbook)
+        else:
+            with open(output, "wb") as f:
+                f.write(workbook)
+            if not args.no_open:
+                os.system(f'start excel "{output}"')
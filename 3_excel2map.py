@@ -1,9 +1,27 @@
+import argparse
+import collections
+import contextlib
+import dis
+import gc
+import io
+import ipaddress
 import openpyxl
 import sys
 import json
 import os
+import re
+import time
+import tracemalloc
+import types
+from concurrent.futures import Future, ProcessPoolExecutor
 from dotenv import load_dotenv
-from typing import Any, Dict, List, Optional, Tuple, Union
+from sheet_extent import iter_until_trailing_blanks, last_non_empty_column
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+try:
+    import resource  # ピークRSS取得用（Windowsでは利用不可）
+except ImportError:
+    resource = None
 
 # .envファイルを読み込む
 # openpyxl: Excelファイル操作ライブラリ
@@ -11,6 +29,11 @@ from typing import Any, Dict, List, Optional, Tuple, Union
 load_dotenv()
 SHEET_PREFIXES = os.getenv("3_SHEET_NAME_PREFIXES").split(",")
 DATA_ROW_START = int(os.getenv("3_DATA_ROW_START", "6"))
+# list(cidr)型の値を集約（隣接・包含するネットワークを結合）するか
+CIDR_COLLAPSE = os.getenv("3_CIDR_COLLAPSE", "false").strip().lower() == "true"
+
+# list(cidr)型のセルは改行・カンマ・空白のいずれでも区切れる
+_CIDR_SPLIT_RE = re.compile(r"[\s,]+")
 
 
 def pretty_format_tf(value: Any, indent: int = 0) -> str:
@@ -106,6 +129,53 @@ def pretty_format_list_object(value: Any, indent: int = 0) -> str:
         return pretty_format_tf(value, indent)
 
 
+def parse_cidr_list(cell_value: Any, collapse: bool = False
+                    ) -> Tuple[List[str], List[str]]:
+    """
+    CIDR/IPアドレスのリストを1回の分割で解析し、正規化する。
+    
+    引数:
+        cell_value: 改行・カンマ・空白区切りのアドレス文字列
+        collapse: Trueの場合、隣接・包含するネットワークを集約する
+        
+    戻り値:
+        以下を含むタプル:
+        - 重複を除きIPv4、IPv6の順にソートしたアドレスのリスト
+        - 解析できなかった値のリスト
+        
+    注意:
+        ホスト部にビットが立っているCIDR（例: 10.0.0.1/24）は不正として扱います。
+        単一ホスト（/32, /128）はプレフィックスなしのアドレスとして出力します。
+    """
+    if cell_value is None:
+        return [], []
+    networks = set()
+    invalid: List[str] = []
+    for token in _CIDR_SPLIT_RE.split(str(cell_value)):
+        if not token:
+            continue
+        try:
+            networks.add(ipaddress.ip_network(token))
+        except ValueError:
+            invalid.append(token)
+
+    if collapse:
+        collapsed = []
+        for version in (4, 6):
+            collapsed.extend(ipaddress.collapse_addresses(
+                n for n in networks if n.version == version
+            ))
+        networks = set(collapsed)
+
+    ordered = sorted(
+        networks, key=lambda n: (n.version, n.network_address, n.prefixlen)
+    )
+    return [
+        str(n.network_address) if n.prefixlen == n.max_prefixlen else str(n)
+        for n in ordered
+    ], invalid
+
+
 def convert(elem_type: str, val: Any) -> Any:
     """
     文字列値を型指定に基づいて適切な型に変換する。
@@ -131,6 +201,13 @@ def convert(elem_type: str, val: Any) -> Any:
         if val is None:
             return []
         return [item.strip() for item in val.split(",")]
+    elif elem_type == "list(cidr)":
+        values, invalid = parse_cidr_list(val, CIDR_COLLAPSE)
+        if invalid:
+            raise ValueError(
+                f"Invalid CIDR/IP address(es): {', '.join(invalid)}"
+            )
+        return values
     elif elem_type == "list(object)":
         if val is None:
             return []
@@ -179,7 +256,7 @@ def format_value(value: Any, typ: str, field: Optional[str] = None,
             return f'"{value}"'
         else:  # number
             return str(value)
-    elif typ == "list":
+    elif typ in ["list", "list(cidr)"]:
         # 空の場合は空リスト
         return json.dumps(value or [], ensure_ascii=False)
     # elif typ == "map":
@@ -234,21 +311,35 @@ def _parse_sheet_metadata(sheet: Any) -> Tuple[List[str], List[str],
     例外:
         ValueError: map(object)型に必須の'key'フィールドが不足している場合
     """
-    max_col = sheet.max_column
     headers: List[str] = []
     column_types: List[str] = []
     object_type_defs: Dict[int, Dict[str, str]] = {}
     object_field_counts: List[int] = []
+
+    # 書式だけが設定された列を除くため、ヘッダー行の最後の空でない列までを対象とする
+    header_row = next(
+        sheet.iter_rows(min_row=1, max_row=1, values_only=True), ()
+    )
+    max_col = last_non_empty_column(header_row)
+
+    # 1〜4行目をまとめて読み込む（read_onlyモードではセル単位の参照が遅いため）
+    meta_rows = [
+        list(row[:max_col]) + [None] * (max_col - len(row))
+        for row in sheet.iter_rows(
+            min_row=1, max_row=4, max_col=max_col, values_only=True
+        )
+    ] if max_col else []
+    meta_rows += [[None] * max_col] * (4 - len(meta_rows))
     
     for col in range(1, max_col + 1):
-        header = sheet.cell(row=1, column=col).value
+        header = meta_rows[0][col - 1]
         headers.append(header)
-        col_type = sheet.cell(row=2, column=col).value or "string"
+        col_type = meta_rows[1][col - 1] or "string"
         column_types.append(col_type)
         
         # 3行目からオブジェクト型定義を解析
         if col_type in ["map(object)", "object", "list(object)"]:
-            definitions = sheet.cell(row=3, column=col).value
+            definitions = meta_rows[2][col - 1]
             object_def: Dict[str, str] = {}
             if definitions:
                 for line in definitions.splitlines():
@@ -264,7 +355,7 @@ def _parse_sheet_metadata(sheet: Any) -> Tuple[List[str], List[str],
             object_type_defs[col - 1] = object_def
         
         # 4行目からフィールド数を取得
-        object_num = sheet.cell(row=4, column=col).value
+        object_num = meta_rows[3][col - 1]
         try:
             object_field_counts.append(int(object_num))
         except (ValueError, TypeError):
@@ -320,19 +411,24 @@ def _create_reference_map(headers: List[str], column_types: List[str],
             and hdr in merged_object_defs
         ):
             for field, ftype in merged_object_defs[hdr].items():
-                if ftype in ["map(object)", "object", "list(object)", "list"]:
+                if ftype in ["map(object)", "object", "list(object)", "list",
+                             "list(cidr)"]:
                     if hdr not in ref_header_map:
                         ref_header_map[hdr] = []
                     ref_header_map[hdr].append(field)
     return ref_header_map
 
 
-def _parse_object2_data(cell_value: str) -> Dict[str, Any]:
+def _parse_object2_data(cell_value: str,
+                        parse_cidrs: Optional[Callable[[str, str], List[str]]] = None
+                        ) -> Dict[str, Any]:
     """
     object2型のデータをパースして辞書に変換する。
     
     引数:
         cell_value: 'key名:keyデータ型:value'形式の文字列（複数行可）
+        parse_cidrs: list(cidr)型の値を(値, key名)から変換する関数（オプション）。
+            指定しない場合は不正な値があった時点でValueErrorを送出する
         
     戻り値:
         変換されたキーと値のマッピング
@@ -361,42 +457,668 @@ def _parse_object2_data(cell_value: str) -> Dict[str, Any]:
         raw_value = parts[2].strip()
         
         # 型に応じた変換を適用
-        converted_value = convert(key_type, raw_value)
+        if key_type == "list(cidr)" and parse_cidrs is not None:
+            converted_value = parse_cidrs(raw_value, key_name)
+        else:
+            converted_value = convert(key_type, raw_value)
         result[key_name] = converted_value
         
     return result
 
 
-def excel_to_tfvars(excel_filepath: str, sheet_title: str,
-                    output_filepath: str) -> None:
+def _convert_row(row: Tuple[Any, ...], row_key: Any, sheet_title: str,
+                 headers: List[str], column_types: List[str],
+                 object_field_counts: List[int],
+                 merged_object_defs: Dict[str, Dict[str, str]],
+                 cidr_errors: Optional[List[str]] = None
+                 ) -> Dict[str, Any]:
     """
-    Excelシートをterraform.tfvars形式に変換する。
+    1データ行の各セルを列の型に従って変換する。
     
     引数:
-        excel_filepath: Excelファイルへのパス
-        sheet_title: 変換するシート名
-        output_filepath: 出力するtfvarsファイルのパス
+        row: セル値のタプル（values_only=Trueで取得した行）
+        row_key: 行のキー（A列の値）
+        sheet_title: エラーメッセージ用のシート名
+        headers: 列ヘッダーのリスト
+        column_types: 列の型のリスト
+        object_field_counts: 列ごとのフィールド数のリスト
+        merged_object_defs: マージされたオブジェクト定義
+        cidr_errors: list(cidr)型の不正な値を蓄積するリスト（オプション）。
+            指定しない場合は不正な値があった時点でValueErrorを送出する
+        
+    戻り値:
+        ヘッダー名から変換済みの値へのマッピング
         
     例外:
-        ValueError: データ行のキーがNoneの場合やデータ形式が無効な場合
+        ValueError: bool値やオブジェクトの要素数が不正な場合
+    """
+    def parse_cidrs(raw: Any, header: str) -> List[str]:
+        values, invalid = parse_cidr_list(raw, CIDR_COLLAPSE)
+        for token in invalid:
+            message = f"key '{row_key}', '{header}': '{token}'"
+            if cidr_errors is None:
+                raise ValueError(
+                    f"Error in sheet '{sheet_title}': invalid CIDR/IP address "
+                    f"for {message}"
+                )
+            cidr_errors.append(message)
+        return values
+
+    row_values: Dict[str, Any] = {}
+    for idx in range(1, len(headers)):
+        cell_value = row[idx]
+        col_type = column_types[idx]
+        header = headers[idx]
+        object_num = object_field_counts[idx]
+        # 型に応じた変換処理
+        if cell_value is not None or cell_value == "":
+            if col_type == "string":
+                converted_value = str(cell_value)
+            elif col_type == "number":
+                try:
+                    converted_value = (
+                        float(cell_value)
+                        if "." in str(cell_value)
+                        else int(cell_value)
+                    )
+                except:
+                    converted_value = cell_value
+
+            # ブール値の厳密な検証
+            elif col_type == "bool":
+                if cell_value not in ("true", "false"):
+                    raise ValueError(
+                        f"Error in sheet '{sheet_title}' for key '{row_key}', "
+                        f"type:{col_type} '{header}' expects 'true' or 'false' "
+                        f"but got '{cell_value}'"
+                    )
+                converted_value = cell_value.strip().lower() == "true"
+            elif col_type == "list":
+                converted_value = (
+                    cell_value.splitlines()
+                    if (isinstance(cell_value, str) and "\n" in cell_value)
+                    else [cell_value]
+                )
+            elif col_type == "list(cidr)":
+                converted_value = parse_cidrs(cell_value, header)
+            # 新しいobject2型の処理
+            elif col_type == "object2":
+                converted_value = _parse_object2_data(
+                    cell_value,
+                    lambda raw, key_name: parse_cidrs(raw, f"{header}.{key_name}")
+                )
+            elif col_type in ["map(object)", "object", "list(object)"]:
+                lines = str(cell_value).splitlines()
+                if header in merged_object_defs:
+                    objects = []
+                    for line in lines:
+                        values_list = [p.strip() for p in line.split(":")]
+                        if len(values_list) != object_field_counts[idx]:
+                            # 要素は':'で区切るため、IPv6アドレスは書けない
+                            hint = (
+                                " (list(cidr) fields in object definitions "
+                                "accept IPv4 only)"
+                                if "list(cidr)" in merged_object_defs[header].values()
+                                else ""
+                            )
+                            raise ValueError(
+                                f"Error in sheet '{sheet_title}' for key "
+                                f"'{row_key}', type:{col_type} '{header}' "
+                                f"expects {object_field_counts[idx]} elements "
+                                f"but got {len(values_list)} in line: {line}{hint}"
+                            )
+                        obj = {}
+                        for i, key_elem in enumerate(
+                            merged_object_defs[header].keys()
+                        ):
+                            if col_type == "map(object)" and i == 0:
+                                continue
+                            idx_offset = i - 1 if col_type == "map(object)" else i
+                            raw = (
+                                values_list[idx_offset]
+                                if idx_offset < len(values_list)
+                                else None
+                            )
+                            elem_type = merged_object_defs[header][key_elem]
+                            if elem_type == "list(cidr)":
+                                obj[key_elem] = parse_cidrs(
+                                    raw, f"{header}.{key_elem}"
+                                )
+                            else:
+                                obj[key_elem] = convert(elem_type, raw)
+                        objects.append(obj)
+                    if col_type == "object":
+                        converted_value = objects[0] if objects else None
+                    else:
+                        converted_value = objects
+                else:
+                    converted_value = cell_value
+            else:
+                converted_value = cell_value
+            row_values[header] = converted_value
+        else:
+            if col_type in ["map(object)", "object"]:
+                row_values[header] = {}
+            elif col_type in ["list", "list(cidr)", "list(object)"]:
+                row_values[header] = []
+            else:
+                row_values[header] = None
+    return row_values
+
+
+def _merge_references(row_values: Dict[str, Any], headers: List[str],
+                      ref_header_map: Dict[str, List[str]],
+                      merged_object_defs: Dict[str, Dict[str, str]],
+                      header_type_dict: Dict[str, str]) -> None:
+    """
+    参照先の列の値を参照元のオブジェクトにネストして結合する。
+    
+    引数:
+        row_values: _convert_rowで変換した1行分の値（その場で更新される）
+        headers: 列ヘッダーのリスト
+        ref_header_map: 参照マッピング辞書
+        merged_object_defs: マージされたオブジェクト定義
+        header_type_dict: ヘッダーから型へのマッピング
+        
+    例外:
+        ValueError: 参照先の型がサポートされていない場合
+    """
+    for src_hdr, dest_list in ref_header_map.items():
+        for dest_hdr in dest_list:
+            if src_hdr in {h for h in headers} and dest_hdr in {h for h in headers}:
+                if (
+                    src_hdr in row_values
+                    and dest_hdr in row_values
+                    and row_values[dest_hdr] is not None
+                ):
+                    src_val = row_values[src_hdr]
+                    if not isinstance(src_val, list):
+                        src_val = [src_val]
+                    dest_val = row_values[dest_hdr]
+                    if isinstance(dest_val, list):
+                        dest_objs = dest_val
+                    else:
+                        dest_objs = [dest_val]
+                    if not dest_objs:
+                        continue
+                    for obj_index, obj in enumerate(src_val):
+                        if obj is None or not isinstance(obj, dict):
+                            obj = {}
+                            src_val[obj_index] = obj
+                        counter = 1
+                        dest_def = merged_object_defs.get(dest_hdr, {})
+                        dest_prefix = dest_def.get("key", dest_hdr)
+                        for d_obj in dest_objs:
+                            dest_field_type = header_type_dict.get(dest_hdr)
+                            if dest_field_type in ["list", "list(cidr)"]:
+                                if dest_hdr not in obj or not isinstance(
+                                    obj[dest_hdr], list
+                                ):
+                                    obj[dest_hdr] = []
+                                obj[dest_hdr].append(d_obj)
+                            elif dest_field_type == "object":
+                                if dest_hdr not in obj or not isinstance(
+                                    obj[dest_hdr], dict
+                                ):
+                                    obj[dest_hdr] = {}
+                                obj[dest_hdr] = d_obj
+                            elif dest_field_type in ["map(object)"]:
+                                if dest_hdr not in obj or not isinstance(
+                                    obj[dest_hdr], dict
+                                ):
+                                    obj[dest_hdr] = {}
+                                sub_key = f"{dest_prefix}{counter:02d}"
+                                obj[dest_hdr][sub_key] = d_obj
+                            elif dest_field_type == "list(object)":
+                                if dest_hdr not in obj or not isinstance(
+                                    obj[dest_hdr], list
+                                ):
+                                    obj[dest_hdr] = []
+                                obj[dest_hdr].append(d_obj)
+                            else:
+                                raise ValueError(
+                                    f"Error: Unsupported type '{dest_field_type}' for '{dest_hdr}'"
+                                )
+                            counter += 1
+                        row_values[src_hdr] = src_val
+                row_values.pop(dest_hdr, None)
+
+
+def _render_entry(key: Any, data: Dict[str, Any],
+                  header_type_dict: Dict[str, str],
+                  merged_object_defs: Dict[str, Dict[str, str]]) -> str:
+    """
+    1キー分のブロックをtfvars形式の文字列として組み立てる。
+    
+    引数:
+        key: マップのキー
+        data: フィールド名から値へのマッピング
+        header_type_dict: ヘッダーから型へのマッピング
+        merged_object_defs: マージされたオブジェクト定義
         
+    戻り値:
+        '  "key" = { ... },' 形式の文字列（末尾改行付き）
+    """
+    parts = [f'  "{key}" = {{\n']
+    for field, value in data.items():
+        typ = header_type_dict.get(field)
+        val_str = format_value(value, typ, field, merged_object_defs)
+        parts.append(f"    {field} = {val_str}\n")
+    parts.append("  },\n")
+    return "".join(parts)
+
+
+def _write_sheet_block(tfvars_file: Any, sheet_title: str,
+                       tfvars_data_map: Dict[str, Dict[str, Any]],
+                       header_type_dict: Dict[str, str],
+                       merged_object_defs: Dict[str, Dict[str, str]],
+                       sample: Optional[Callable[[], None]] = None) -> None:
+    """
+    1シート分の'シート名 = { ... }'ブロックをストリームに書き出す。
+    
     注意:
-        Excelシートの構造:
-        - 1行目: ヘッダー
-        - 2行目: データ型
-        - 3行目: オブジェクト定義（複合型の場合）
-        - 4行目: フィールド数
-        - 5行目: Description（オプション）
-        - 6行目以降: データ行（DATA_ROW_START環境変数で設定可能）
+        sampleには組み立てたエントリの文字列を書き出す前に呼び出す
+        MemoryProfiler.sampleを指定できます。
+    """
+    tfvars_file.write(f"{sheet_title} = {{\n")
+
+    # シート内の各キーごとにブロックを出力
+    for key, data in tfvars_data_map.items():
+        entry = _render_entry(key, data, header_type_dict, merged_object_defs)
+        if sample is not None:
+            sample()
+        tfvars_file.write(entry)
+    tfvars_file.write("}\n")
+
+
+class MemoryProfiler:
+    """
+    シート・処理フェーズごとのメモリ使用量を計測する（--profile-memory指定時のみ）。
+    
+    tracemallocでフェーズ内のピーク割り当て量と割り当て増加の多い箇所を、
+    フェーズ開始・終了時のRSSと、resourceモジュールが使える環境では
+    プロセスのピークRSSを記録します。
+    """
+
+    # sample()でスナップショットを取り直す割り当て量の増加率
+    SAMPLE_GROWTH = 1.1
+
+    def __init__(self, top_n: int = 10, sample_interval: int = 1000,
+                 report_filepath: Optional[str] = None,
+                 excel_filepath: Optional[str] = None) -> None:
+        self.top_n = top_n
+        self.sample_interval = sample_interval
+        # 指定した場合はフェーズごとにレポートを書き直す（OOMで強制終了されても
+        # それまでのフェーズの結果が残るように）
+        self.report_filepath = report_filepath
+        self.excel_filepath = excel_filepath
+        self.records: List[Dict[str, Any]] = []
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._in_phase = False
+        self._sample_calls = 0
+        self._sample_bytes = 0
+        self._sample_snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def start(self) -> None:
+        tracemalloc.start()
+        self._snapshot = self._take_snapshot()
+
+    def stop(self) -> None:
+        tracemalloc.stop()
+        self._snapshot = None
+
+    @staticmethod
+    def _take_snapshot() -> "tracemalloc.Snapshot":
+        # filter_tracesは全トレースをPythonで走査して遅いため、除外は集計時に行う
+        return tracemalloc.take_snapshot()
+
+    @staticmethod
+    def _peak_rss_bytes() -> Optional[int]:
+        # プロセス開始からの最大値のため、フェーズ間の比較にはcurrent RSSを使う
+        if resource is None:
+            return None
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOSはバイト単位、Linuxはキロバイト単位
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    @staticmethod
+    def _current_rss_bytes() -> Optional[int]:
+        # /proc/self/statmの2番目の値が常駐ページ数（Linuxのみ）
+        try:
+            with open("/proc/self/statm", "r") as f:
+                resident_pages = int(f.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            return None
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+    def sample(self) -> None:
+        """
+        フェーズ内の処理中に呼び出し、sample_interval回ごとに割り当て量を確認する。
         
-        object2型のデータ形式:
-        - 2行目: 'object2'と指定
-        - 3,4行目: 空
-        - データ行: 'key名:keyデータ型:value'形式（複数行可）
+        注意:
+            それまでの最大値をSAMPLE_GROWTH倍超えていればスナップショットを取り直し、
+            フェーズ終了時より割り当て量が多ければ割り当て箇所の集計に使います。
+            フェーズ終了前に解放される一時的な割り当て（文字列の組み立てなど）は
+            終了時のスナップショットには現れないためです。
+        """
+        if not self._in_phase:
+            return
+        self._sample_calls += 1
+        if self._sample_calls % self.sample_interval:
+            return
+        current, _ = tracemalloc.get_traced_memory()
+        # スナップショットの取得は重いため、最大値を一定割合超えた場合だけ取り直す
+        if current <= self._sample_bytes * self.SAMPLE_GROWTH:
+            return
+        # 古いスナップショットを先に解放してから取り直す
+        self._sample_snapshot = None
+        self._sample_bytes = current
+        self._sample_snapshot = self._take_snapshot()
+
+    def _top_allocations(self, snapshot: "tracemalloc.Snapshot"
+                         ) -> List[Dict[str, Any]]:
+        # フェーズ開始時からの増加が多い箇所（tracemalloc自身やimport機構、
+        # プロファイラー自身の行は除く）
+        if self._snapshot is None:
+            return []
+        top_allocations = []
+        for stat in snapshot.compare_to(self._snapshot, "lineno"):
+            frame = stat.traceback[0]
+            if (stat.size_diff <= 0 or frame.filename in _EXCLUDED_FILES
+                    or (frame.filename, frame.lineno) in _PROFILER_LINES):
+                continue
+            top_allocations.append({
+                "site": f"{frame.filename}:{frame.lineno}",
+                "size_diff_bytes": stat.size_diff,
+                "count_diff": stat.count_diff,
+            })
+            if len(top_allocations) >= self.top_n:
+                break
+        return top_allocations
+
+    @contextlib.contextmanager
+    def phase(self, sheet_title: str, phase_name: str) -> Iterator[None]:
+        """
+        ブロック内の処理を1フェーズとして計測する。
+        
+        引数:
+            sheet_title: 対象のシート名
+            phase_name: フェーズ名（workbook_load, metadata_parseなど）
+        """
+        tracemalloc.reset_peak()
+        start_current, _ = tracemalloc.get_traced_memory()
+        start_rss = self._current_rss_bytes()
+        self._in_phase = True
+        self._sample_calls = 0
+        self._sample_bytes = 0
+        self._sample_snapshot = None
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._in_phase = False
+            current, peak = tracemalloc.get_traced_memory()
+            end_rss = self._current_rss_bytes()
+            snapshot = self._take_snapshot()
+            # 処理中のサンプルの方が多ければ、ピークに近いそちらで集計する
+            if self._sample_snapshot is not None and self._sample_bytes > current:
+                top_allocations = self._top_allocations(self._sample_snapshot)
+                allocations_at = "sample"
+                allocations_bytes = self._sample_bytes
+            else:
+                top_allocations = self._top_allocations(snapshot)
+                allocations_at = "phase_end"
+                allocations_bytes = current
+            self._sample_snapshot = None
+            self._snapshot = snapshot
+            self.records.append({
+                "sheet": sheet_title,
+                "phase": phase_name,
+                "elapsed_seconds": round(elapsed, 6),
+                "start_bytes": start_current,
+                "end_bytes": current,
+                "peak_bytes": peak,
+                "peak_growth_bytes": peak - start_current,
+                "start_rss_bytes": start_rss,
+                "end_rss_bytes": end_rss,
+                "rss_delta_bytes": (
+                    end_rss - start_rss
+                    if start_rss is not None and end_rss is not None else None
+                ),
+                "peak_rss_bytes": self._peak_rss_bytes(),
+                "top_allocations_at": allocations_at,
+                "top_allocations_bytes": allocations_bytes,
+                "top_allocations": top_allocations,
+            })
+            if self.report_filepath is not None:
+                self.write_report(self.report_filepath, self.excel_filepath,
+                                  completed=False)
+                # indent付きのjson出力は循環参照するクロージャを残すため、
+                # 次のフェーズの割り当て箇所に現れないよう回収しておく
+                gc.collect()
+
+    def write_report(self, report_filepath: str, excel_filepath: Optional[str],
+                     completed: bool = True) -> None:
+        """
+        計測結果をJSONレポートとして出力する。
+        
+        引数:
+            report_filepath: 出力するJSONファイルのパス
+            excel_filepath: 変換元のExcelファイルのパス
+            completed: すべてのシートの変換が終わったか（途中経過の場合はFalse）
+            
+        注意:
+            書き込み中に強制終了されてもレポートが壊れないよう、一時ファイルに
+            書き出してから置き換えます。
+        """
+        sheets: Dict[str, Dict[str, Any]] = {}
+        for record in self.records:
+            summary = sheets.setdefault(record["sheet"], {
+                "peak_bytes": 0, "peak_phase": None,
+                "rss_delta_bytes": None, "rss_delta_phase": None,
+            })
+            if record["peak_bytes"] >= summary["peak_bytes"]:
+                summary["peak_bytes"] = record["peak_bytes"]
+                summary["peak_phase"] = record["phase"]
+            # RSSの増加が最も大きいフェーズ（OOMの原因の特定用）
+            rss_delta = record["rss_delta_bytes"]
+            if rss_delta is not None and (
+                summary["rss_delta_bytes"] is None
+                or rss_delta > summary["rss_delta_bytes"]
+            ):
+                summary["rss_delta_bytes"] = rss_delta
+                summary["rss_delta_phase"] = record["phase"]
+        report = {
+            "excel_filepath": excel_filepath,
+            "completed": completed,
+            "sheets": sheets,
+            "phases": self.records,
+        }
+        temp_filepath = f"{report_filepath}.tmp"
+        with open(temp_filepath, "w", encoding="utf-8", newline="\n") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        os.replace(temp_filepath, report_filepath)
+
+
+def _no_phase(sheet_title: str, phase_name: str) -> contextlib.nullcontext:
+    # プロファイル無効時のphase()の代替
+    return contextlib.nullcontext()
+
+
+def _no_sample() -> None:
+    # プロファイル無効時のsample()の代替
+    pass
+
+
+def _class_code_lines(cls: type) -> Set[Tuple[str, int]]:
     """
-    wb = openpyxl.load_workbook(excel_filepath)
-    sheet = wb[sheet_title]
+    クラスのメソッド（ネストした関数・ジェネレーターを含む）のコードオブジェクトが
+    占める(ファイル名, 行番号)の集合を返す。
+
+    注意:
+        複数行にわたる式の途中の行も含めるため、各コードオブジェクトの
+        最初の行から最後の行までを対象とします。
+    """
+    lines: Set[Tuple[str, int]] = set()
+    stack = []
+    for attr in vars(cls).values():
+        func = getattr(attr, "__func__", attr)  # staticmethod
+        func = getattr(func, "__wrapped__", func)  # contextmanager
+        if hasattr(func, "__code__"):
+            stack.append(func.__code__)
+    while stack:
+        code = stack.pop()
+        linenos = [
+            lineno for _, lineno in dis.findlinestarts(code) if lineno is not None
+        ]
+        if linenos:
+            lines.update(
+                (code.co_filename, lineno)
+                for lineno in range(code.co_firstlineno, max(linenos) + 1)
+            )
+        stack.extend(c for c in code.co_consts if isinstance(c, types.CodeType))
+    return lines
+
+
+# 割り当て箇所の集計から除くファイルとMemoryProfiler自身の行
+_EXCLUDED_FILES = {
+    tracemalloc.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+}
+_PROFILER_LINES = _class_code_lines(MemoryProfiler)
+
+
+_BLOCK_START_RE = re.compile(r"^(\S+) = \{$")
+_ENTRY_START_RE = re.compile(r'^  "(.*)" = \{$')
 
+
+def _split_blocks(lines: List[str], start_re: "re.Pattern[str]",
+                  end_line: str) -> List[Tuple[Optional[str], List[str]]]:
+    """
+    出力済みのtfvarsの行を名前付きブロックとそれ以外の行に分割する。
+    
+    引数:
+        lines: 改行を含まない行のリスト
+        start_re: ブロック開始行の正規表現（グループ1がブロック名）
+        end_line: ブロック終了行
+        
+    戻り値:
+        (ブロック名またはNone, 行のリスト)のタプルのリスト
+    """
+    blocks: List[Tuple[Optional[str], List[str]]] = []
+    current: Optional[List[str]] = None
+    for line in lines:
+        if current is None:
+            match = start_re.match(line)
+            if match:
+                current = [line]
+                blocks.append((match.group(1), current))
+            elif blocks and blocks[-1][0] is None:
+                blocks[-1][1].append(line)
+            else:
+                blocks.append((None, [line]))
+        else:
+            current.append(line)
+            if line == end_line:
+                current = None
+    return blocks
+
+
+def _merge_into_output(output_filepath: str, sheet_title: str,
+                       rendered_entries: Dict[str, str],
+                       replace_sheet: bool) -> None:
+    """
+    部分変換の結果を既存の出力ファイルにマージする。
+    
+    引数:
+        output_filepath: 出力するtfvarsファイルのパス
+        sheet_title: シート名（ブロック名）
+        rendered_entries: キーから_render_entryで組み立てた文字列へのマッピング
+        replace_sheet: Trueの場合はシートのブロック全体を置き換え、
+            Falseの場合は指定したキーのエントリだけを置き換え・追加する
+    """
+    lines: List[str] = []
+    if os.path.exists(output_filepath):
+        with open(output_filepath, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    blocks = _split_blocks(lines, _BLOCK_START_RE, "}")
+
+    def build_block(entries: List[str]) -> List[str]:
+        return ([f"{sheet_title} = {{"]
+                + "".join(entries).splitlines() + ["}"])
+
+    for i, (name, block_lines) in enumerate(blocks):
+        if name != sheet_title:
+            continue
+        if replace_sheet:
+            blocks[i] = (name, build_block(list(rendered_entries.values())))
+        else:
+            # 既存のエントリは位置を保ったまま置き換え、新しいキーは末尾に追加する
+            remaining = dict(rendered_entries)
+            entries: List[str] = []
+            for key, entry_lines in _split_blocks(
+                block_lines[1:-1], _ENTRY_START_RE, "  },"
+            ):
+                if key is not None and key in remaining:
+                    entries.append(remaining.pop(key))
+                else:
+                    entries.append("\n".join(entry_lines) + "\n")
+            entries.extend(remaining.values())
+            blocks[i] = (name, build_block(entries))
+        break
+    else:
+        if not rendered_entries and not replace_sheet:
+            return
+        blocks.append((sheet_title, build_block(list(rendered_entries.values()))))
+
+    with open(output_filepath, "w", encoding="utf-8", newline="\n") as f:
+        for _, block_lines in blocks:
+            f.write("\n".join(block_lines) + "\n")
+
+
+def select_sheets(sheet_names: List[str],
+                  selected: Optional[List[str]] = None) -> List[str]:
+    """
+    変換対象のシートを選択する。
+    
+    引数:
+        sheet_names: ワークブック内のシート名のリスト
+        selected: 変換するシート名のリスト（省略時は3_SHEET_NAME_PREFIXESで判定）
+        
+    戻り値:
+        変換対象のシート名のリスト
+        
+    例外:
+        ValueError: 指定したシートがワークブックに存在しない場合
+    """
+    if selected:
+        missing = [name for name in selected if name not in sheet_names]
+        if missing:
+            raise ValueError(f"Sheets not found: {', '.join(missing)}")
+        return list(selected)
+    # 設定されたプレフィックスに一致するシートを処理
+    return [
+        name for name in sheet_names
+        if any(name.startswith(prefix) for prefix in SHEET_PREFIXES)
+    ]
+
+
+def _parse_schema(sheet: Any) -> Tuple[List[str], List[str], List[int],
+                                       Dict[str, Dict[str, str]],
+                                       Dict[str, List[str]], Dict[str, str]]:
+    """
+    シートのヘッダー行から、データ行の変換に必要なスキーマを組み立てる。
+    
+    引数:
+        sheet: openpyxlワークシートオブジェクト
+        
+    戻り値:
+        (headers, column_types, object_field_counts, merged_object_defs,
+         ref_header_map, header_type_dict)のタプル
+    """
     # シートのメタデータをヘッダー行から解析
     headers, column_types, object_type_defs, object_field_counts = (
         _parse_sheet_metadata(sheet)
@@ -416,195 +1138,601 @@ def excel_to_tfvars(excel_filepath: str, sheet_title: str,
     header_type_dict: Dict[str, str] = {
         headers[i]: column_types[i] for i in range(1, len(headers))
     }
+    return (headers, column_types, object_field_counts, merged_object_defs,
+            ref_header_map, header_type_dict)
 
-    # データ行の処理
-    tfvars_data_map: Dict[str, Dict[str, Any]] = {}
-    for row_idx, row in enumerate(
-        sheet.iter_rows(min_row=DATA_ROW_START, values_only=True), start=DATA_ROW_START
+
+def _iter_data_rows(sheet: Any, max_col: int, keys: Optional[Set[str]] = None
+                    ) -> Iterator[Tuple[Any, int, Tuple[Any, ...]]]:
+    """
+    データ行を(キー, 行番号, セル値のタプル)として順に返す。
+    
+    引数:
+        sheet: openpyxlワークシートオブジェクト
+        max_col: 読み込む最終列
+        keys: 変換するキーの集合（オプション）。指定した場合はそれ以外の行を返さない
+        
+    例外:
+        ValueError: データ行のキーがNoneの場合
+        
+    注意:
+        同じキーの行が後にもある場合、全体の変換では最後の行の値が出力されるため、
+        すべてのキーが見つかった後もシートの最後まで読み込みます。
+    """
+    remaining_keys = set(keys) if keys is not None else set()
+    # 末尾の空行（書式だけが設定された行など）は読み飛ばす
+    for row_idx, row in iter_until_trailing_blanks(
+        sheet.iter_rows(
+            min_row=DATA_ROW_START, max_col=max_col, values_only=True
+        ),
+        DATA_ROW_START
     ):
         row_key = row[0]
         if row_key is None:
             raise ValueError(f"Error: Key is None in row {row_idx}")
+        if keys is not None:
+            if str(row_key) not in keys:
+                continue
+            remaining_keys.discard(str(row_key))
+        yield row_key, row_idx, row
+    if remaining_keys:
+        print(f"Keys not found in {sheet.title}: {', '.join(sorted(remaining_keys))}")
+
+
+def _raise_cidr_errors(sheet_title: str, cidr_errors: List[str]) -> None:
+    # 不正なCIDR/IPアドレスはシート単位でまとめて報告する
+    if cidr_errors:
+        raise ValueError(
+            f"Error in sheet '{sheet_title}': {len(cidr_errors)} invalid "
+            f"CIDR/IP address(es):\n  " + "\n  ".join(cidr_errors)
+        )
+
+
+def convert_sheet(excel_filepath: Any, sheet_title: str,
+                  profiler: Optional[MemoryProfiler] = None,
+                  keys: Optional[Set[str]] = None
+                  ) -> Tuple[List[Tuple[Any, int, Dict[str, Any]]],
+                             Dict[str, str], Dict[str, Dict[str, str]]]:
+    """
+    Excelシートを読み込み、データ行を変換して参照先の値を結合する。
+    
+    引数:
+        excel_filepath: Excelファイルへのパス、またはファイルオブジェクト
+        sheet_title: 変換するシート名
+        profiler: フェーズごとのメモリ計測を行う場合のMemoryProfiler（オプション）
+        keys: 変換するキーの集合（オプション）。指定した場合はそれ以外の行を
+            変換しない
         
-        row_values: Dict[str, Any] = {}
-        for idx in range(1, len(headers)):
-            cell_value = row[idx]
-            col_type = column_types[idx]
-            header = headers[idx]
-            object_num = object_field_counts[idx]
-            # 型に応じた変換処理
-            if cell_value is not None or cell_value == "":
-                if col_type == "string":
-                    converted_value = str(cell_value)
-                elif col_type == "number":
-                    try:
-                        converted_value = (
-                            float(cell_value)
-                            if "." in str(cell_value)
-                            else int(cell_value)
-                        )
-                    except:
-                        converted_value = cell_value
-
-                # ブール値の厳密な検証
-                elif col_type == "bool":
-                    if cell_value not in ("true", "false"):
-                        raise ValueError(
-                            f"Error in sheet '{sheet.title}' for key '{row_key}', "
-                            f"type:{col_type} '{header}' expects 'true' or 'false' "
-                            f"but got '{cell_value}'"
-                        )
-                    converted_value = cell_value.strip().lower() == "true"
-                elif col_type == "list":
-                    converted_value = (
-                        cell_value.splitlines()
-                        if (isinstance(cell_value, str) and "\n" in cell_value)
-                        else [cell_value]
-                    )
-                # 新しいobject2型の処理
-                elif col_type == "object2":
-                    converted_value = _parse_object2_data(cell_value)
-                elif col_type in ["map(object)", "object", "list(object)"]:
-                    lines = str(cell_value).splitlines()
-                    if header in merged_object_defs:
-                        objects = []
-                        for line in lines:
-                            values_list = [p.strip() for p in line.split(":")]
-                            if len(values_list) != object_field_counts[idx]:
-                                raise ValueError(
-                                    f"Error in sheet '{sheet.title}' for key "
-                                    f"'{row_key}', type:{col_type} '{header}' "
-                                    f"expects {object_field_counts[idx]} elements "
-                                    f"but got {len(values_list)} in line: {line}"
-                                )
-                            obj = {}
-                            for i, key_elem in enumerate(
-                                merged_object_defs[header].keys()
-                            ):
-                                if col_type == "map(object)" and i == 0:
-                                    continue
-                                idx_offset = i - 1 if col_type == "map(object)" else i
-                                raw = (
-                                    values_list[idx_offset]
-                                    if idx_offset < len(values_list)
-                                    else None
-                                )
-                                elem_type = merged_object_defs[header][key_elem]
-                                obj[key_elem] = convert(elem_type, raw)
-                            objects.append(obj)
-                        if col_type == "object":
-                            converted_value = objects[0] if objects else None
-                        else:
-                            converted_value = objects
-                    else:
-                        converted_value = cell_value
-                else:
-                    converted_value = cell_value
-                row_values[header] = converted_value
-            else:
-                if col_type in ["map(object)", "object"]:
-                    row_values[header] = {}
-                elif col_type in ["list", "list(object)"]:
-                    row_values[header] = []
-                else:
-                    row_values[header] = None
-        # 変更: 参照先の値を参照元のmapsにネストして結合する
-        for src_hdr, dest_list in ref_header_map.items():
-            for dest_hdr in dest_list:
-                if src_hdr in {h for h in headers} and dest_hdr in {h for h in headers}:
-                    if (
-                        src_hdr in row_values
-                        and dest_hdr in row_values
-                        and row_values[dest_hdr] is not None
-                    ):
-                        src_val = row_values[src_hdr]
-                        if not isinstance(src_val, list):
-                            src_val = [src_val]
-                        dest_val = row_values[dest_hdr]
-                        if isinstance(dest_val, list):
-                            dest_objs = dest_val
-                        else:
-                            dest_objs = [dest_val]
-                        if not dest_objs:
-                            continue
-                        for obj_index, obj in enumerate(src_val):
-                            if obj is None or not isinstance(obj, dict):
-                                obj = {}
-                                src_val[obj_index] = obj
-                            counter = 1
-                            dest_def = merged_object_defs.get(dest_hdr, {})
-                            dest_prefix = dest_def.get("key", dest_hdr)
-                            for d_obj in dest_objs:
-                                dest_field_type = header_type_dict.get(dest_hdr)
-                                if dest_field_type == "list":
-                                    if dest_hdr not in obj or not isinstance(
-                                        obj[dest_hdr], list
-                                    ):
-                                        obj[dest_hdr] = []
-                                    obj[dest_hdr].append(d_obj)
-                                elif dest_field_type == "object":
-                                    if dest_hdr not in obj or not isinstance(
-                                        obj[dest_hdr], dict
-                                    ):
-                                        obj[dest_hdr] = {}
-                                    obj[dest_hdr] = d_obj
-                                elif dest_field_type in ["map(object)"]:
-                                    if dest_hdr not in obj or not isinstance(
-                                        obj[dest_hdr], dict
-                                    ):
-                                        obj[dest_hdr] = {}
-                                    sub_key = f"{dest_prefix}{counter:02d}"
-                                    obj[dest_hdr][sub_key] = d_obj
-                                elif dest_field_type == "list(object)":
-                                    if dest_hdr not in obj or not isinstance(
-                                        obj[dest_hdr], list
-                                    ):
-                                        obj[dest_hdr] = []
-                                    obj[dest_hdr].append(d_obj)
-                                else:
-                                    raise ValueError(
-                                        f"Error: Unsupported type '{dest_field_type}' for '{dest_hdr}'"
-                                    )
-                                counter += 1
-                            row_values[src_hdr] = src_val
-                    row_values.pop(dest_hdr, None)
-        tfvars_data_map[row_key] = row_values
-    # 各ヘッダーの型情報をマッピング（先頭列以外）
+    戻り値:
+        以下を含むタプル:
+        - rows: (キー, 行番号, フィールド名から値へのマッピング)の行順のリスト
+        - header_type_dict: ヘッダーから型へのマッピング
+        - merged_object_defs: マージされたオブジェクト定義
+        
+    例外:
+        ValueError: データ行のキーがNoneの場合やデータ形式が無効な場合
+        
+    注意:
+        Excelシートの構造:
+        - 1行目: ヘッダー
+        - 2行目: データ型
+        - 3行目: オブジェクト定義（複合型の場合）
+        - 4行目: フィールド数
+        - 5行目: Description（オプション）
+        - 6行目以降: データ行（DATA_ROW_START環境変数で設定可能）
+        
+        object2型のデータ形式:
+        - 2行目: 'object2'と指定
+        - 3,4行目: 空
+        - データ行: 'key名:keyデータ型:value'形式（複数行可）
+    """
+    phase = profiler.phase if profiler else _no_phase
+    sample = profiler.sample if profiler else _no_sample
+
+    with phase(sheet_title, "workbook_load"):
+        # read_onlyモードでは参照したシートだけが解析される
+        wb = openpyxl.load_workbook(excel_filepath, read_only=True)
+        sheet = wb[sheet_title]
+
+    with phase(sheet_title, "metadata_parse"):
+        schema = _parse_schema(sheet)
+    (headers, column_types, object_field_counts, merged_object_defs,
+     ref_header_map, header_type_dict) = schema
+
+    # データ行の処理
+    with phase(sheet_title, "row_conversion"):
+        rows: List[Tuple[Any, int, Dict[str, Any]]] = []
+        cidr_errors: List[str] = []
+        for row_key, row_idx, row in _iter_data_rows(sheet, len(headers), keys):
+            rows.append((row_key, row_idx, _convert_row(
+                row, row_key, sheet.title, headers, column_types,
+                object_field_counts, merged_object_defs, cidr_errors
+            )))
+            sample()
+        wb.close()
+        _raise_cidr_errors(sheet_title, cidr_errors)
+
+    # 変更: 参照先の値を参照元のmapsにネストして結合する
+    with phase(sheet_title, "reference_merge"):
+        for _, _, row_values in rows:
+            _merge_references(
+                row_values, headers, ref_header_map, merged_object_defs,
+                header_type_dict
+            )
+            sample()
+
+    return rows, header_type_dict, merged_object_defs
+
+
+def excel_to_tfvars(excel_filepath: Any, sheet_title: str,
+                    output_filepath: Any,
+                    profiler: Optional[MemoryProfiler] = None,
+                    keys: Optional[Set[str]] = None,
+                    merge: bool = False) -> None:
+    """
+    Excelシートをterraform.tfvars形式に変換する。
+    
+    引数:
+        excel_filepath: Excelファイルへのパス、またはファイルオブジェクト
+        sheet_title: 変換するシート名
+        output_filepath: 出力するtfvarsファイルのパス、またはテキストストリーム
+            （ストリームの場合は追記もマージもせず、そのまま書き出す）
+        profiler: フェーズごとのメモリ計測を行う場合のMemoryProfiler（オプション）
+        keys: 変換するキーの集合（オプション）。convert_sheetを参照
+        merge: Trueの場合は出力ファイルに追記せず、既存の同名シートの
+            ブロック（keys指定時は該当キーのエントリ）を置き換える
+        
+    例外:
+        ValueError: データ行のキーがNoneの場合やデータ形式が無効な場合
+        
+    注意:
+        同じキーの行が複数ある場合は、最初の行の位置に最後の行の値を出力します。
+        シートの構造はconvert_sheetを参照してください。
+    """
+    phase = profiler.phase if profiler else _no_phase
+    sample = profiler.sample if profiler else None
+    rows, header_type_dict, merged_object_defs = convert_sheet(
+        excel_filepath, sheet_title, profiler, keys
+    )
 
     # tfvarsファイルとして出力（Terraformの各typeをシンプルに処理）
-    mode = "a" if os.path.exists(output_filepath) else "w"
-    with open(output_filepath, mode, encoding="utf-8", newline="\n") as tfvars_file:
-        tfvars_file.write(f"{sheet.title} = {{\n")
+    with phase(sheet_title, "emission"):
+        tfvars_data_map: Dict[str, Dict[str, Any]] = {
+            row_key: row_values for row_key, _, row_values in rows
+        }
+        del rows
+        if hasattr(output_filepath, "write"):
+            _write_sheet_block(output_filepath, sheet_title, tfvars_data_map,
+                               header_type_dict, merged_object_defs, sample)
+            return
+        if merge:
+            entries: Dict[str, str] = {}
+            for key, data in tfvars_data_map.items():
+                entries[str(key)] = _render_entry(
+                    key, data, header_type_dict, merged_object_defs
+                )
+                if sample is not None:
+                    sample()
+            _merge_into_output(output_filepath, sheet_title, entries,
+                               replace_sheet=keys is None)
+            return
+        mode = "a" if os.path.exists(output_filepath) else "w"
+        with open(output_filepath, mode, encoding="utf-8", newline="\n") as tfvars_file:
+            _write_sheet_block(tfvars_file, sheet_title, tfvars_data_map,
+                               header_type_dict, merged_object_defs, sample)
+
+
+# --row-jobs指定時の1チャンクあたりの行数の既定値
+DEFAULT_CHUNK_SIZE = 2000
+
+# 行チャンク変換のワーカープロセスが保持するシートのスキーマ
+_chunk_schema: Optional[Tuple[Any, ...]] = None
+
 
-        # シート内の各キーごとにブロックを出力
-        for key, data in tfvars_data_map.items():
-            tfvars_file.write(f'  "{key}" = {{\n')
+def _init_chunk_worker(schema: Tuple[Any, ...]) -> None:
+    global _chunk_schema
+    _chunk_schema = schema
 
-            for field, value in data.items():
-                typ = header_type_dict.get(field)
-                val_str = format_value(value, typ, field, merged_object_defs)
-                tfvars_file.write(f"    {field} = {val_str}\n")
 
-            tfvars_file.write("  },\n")
+def _render_chunk(chunk: List[Tuple[Any, int, Tuple[Any, ...]]]
+                  ) -> Tuple[List[Tuple[Any, int, str]], List[str]]:
+    """
+    データ行のチャンクを変換・出力文字列化する（ワーカープロセス用）。
+    
+    戻り値:
+        ((キー, 行番号, 出力文字列)のリスト, 不正なCIDR/IPアドレスのリスト)のタプル
+    """
+    (sheet_title, headers, column_types, object_field_counts,
+     merged_object_defs, ref_header_map, header_type_dict) = _chunk_schema
+    rendered: List[Tuple[Any, int, str]] = []
+    cidr_errors: List[str] = []
+    for row_key, row_idx, row in chunk:
+        row_values = _convert_row(
+            row, row_key, sheet_title, headers, column_types,
+            object_field_counts, merged_object_defs, cidr_errors
+        )
+        _merge_references(
+            row_values, headers, ref_header_map, merged_object_defs,
+            header_type_dict
+        )
+        rendered.append((row_key, row_idx, _render_entry(
+            row_key, row_values, header_type_dict, merged_object_defs
+        )))
+    return rendered, cidr_errors
+
+
+def _chunked(rows: Iterator[Tuple[Any, int, Tuple[Any, ...]]], size: int
+             ) -> Iterator[List[Tuple[Any, int, Tuple[Any, ...]]]]:
+    chunk: List[Tuple[Any, int, Tuple[Any, ...]]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def excel_to_tfvars_parallel(excel_filepath: Any, sheet_title: str,
+                             output_filepath: Any,
+                             keys: Optional[Set[str]] = None,
+                             merge: bool = False,
+                             max_workers: Optional[int] = None,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """
+    1シートのデータ行をチャンクに分割し、ワーカープロセスで並列に変換する。
+    
+    引数:
+        excel_filepath: Excelファイルへのパス、またはファイルオブジェクト
+        sheet_title: 変換するシート名
+        output_filepath: 出力するtfvarsファイルのパス、またはテキストストリーム
+        keys: 変換するキーの集合（オプション）
+        merge: excel_to_tfvarsを参照
+        max_workers: ワーカープロセス数（省略時はCPU数）
+        chunk_size: 1チャンクあたりの行数
+        
+    例外:
+        ValueError: データ行のキーがNoneの場合やデータ形式が無効な場合
+        
+    注意:
+        スキーマの解析、キーの重複検出、出力はこのプロセスで行い、
+        出力結果はexcel_to_tfvarsと同一になります。
+    """
+    wb = openpyxl.load_workbook(excel_filepath, read_only=True)
+    sheet = wb[sheet_title]
+    schema = _parse_schema(sheet)
+    headers = schema[0]
+    max_workers = max_workers or os.cpu_count() or 1
+
+    rendered_map: Dict[Any, str] = {}
+    first_rows: Dict[Any, int] = {}
+    cidr_errors: List[str] = []
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_chunk_worker,
+                             initargs=((sheet_title,) + schema,)) as executor:
+        # 読み込んだ行をすべて送らないよう、実行中のチャンクはワーカー数の
+        # 2倍までとし、先頭のチャンクから行順に結果を受け取って連結する
+        pending: Deque[Future] = collections.deque()
+        chunks = _chunked(_iter_data_rows(sheet, len(headers), keys), chunk_size)
+        while True:
+            for chunk in chunks:
+                pending.append(executor.submit(_render_chunk, chunk))
+                if len(pending) >= 2 * max_workers:
+                    break
+            if not pending:
+                break
+            rendered, chunk_errors = pending.popleft().result()
+            cidr_errors.extend(chunk_errors)
+            for row_key, row_idx, text in rendered:
+                # 逐次変換と同じく、重複したキーは最初の位置に最後の行の値を出力する
+                first_row = first_rows.setdefault(row_key, row_idx)
+                if first_row != row_idx:
+                    print(
+                        f"Duplicate key '{row_key}' in sheet '{sheet_title}': "
+                        f"row {first_row} is overwritten by row {row_idx}"
+                    )
+                rendered_map[row_key] = text
+    wb.close()
+    _raise_cidr_errors(sheet_title, cidr_errors)
+
+    if hasattr(output_filepath, "write"):
+        tfvars_file = output_filepath
+    elif merge:
+        _merge_into_output(output_filepath, sheet_title, {
+            str(key): text for key, text in rendered_map.items()
+        }, replace_sheet=keys is None)
+        return
+    else:
+        mode = "a" if os.path.exists(output_filepath) else "w"
+        tfvars_file = open(output_filepath, mode, encoding="utf-8", newline="\n")
+    try:
+        tfvars_file.write(f"{sheet_title} = {{\n")
+        tfvars_file.writelines(rendered_map.values())
         tfvars_file.write("}\n")
+    finally:
+        if tfvars_file is not output_filepath:
+            tfvars_file.close()
+
+
+def convert_workbook(source: Any, output: Optional[Any] = None,
+                     sheet_names: Optional[List[str]] = None,
+                     keys: Optional[Set[str]] = None) -> Optional[str]:
+    """
+    ワークブックの対象シートをまとめてtfvars形式に変換する。
+    
+    引数:
+        source: Excelファイルのパス、バイト列、またはファイルオブジェクト
+        output: 書き出し先のテキストストリーム（省略時は文字列で返す）
+        sheet_names: 変換するシート名のリスト（省略時は3_SHEET_NAME_PREFIXESで判定）
+        keys: 変換するキーの集合（オプション）
+        
+    戻り値:
+        outputを省略した場合は変換結果の文字列、指定した場合はNone
+        
+    例外:
+        ValueError: 指定したシートが存在しない場合やデータ形式が無効な場合
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    wb = openpyxl.load_workbook(source, read_only=True)
+    available = wb.sheetnames
+    wb.close()
+    stream = output if output is not None else io.StringIO()
+    for sheet_name in select_sheets(available, sheet_names):
+        excel_to_tfvars(source, sheet_name, stream, keys=keys)
+    return None if output is not None else stream.getvalue()
+
+
+def _render_sheet_rows(excel_filepath: str, sheet_title: str,
+                       keys: Optional[Set[str]] = None
+                       ) -> List[Tuple[str, int, str]]:
+    """
+    シートを変換し、(キー, 行番号, 出力文字列)のリストを返す（ワーカープロセス用）。
+    """
+    rows, header_type_dict, merged_object_defs = convert_sheet(
+        excel_filepath, sheet_title, keys=keys
+    )
+    return [
+        (str(row_key), row_idx,
+         _render_entry(row_key, row_values, header_type_dict, merged_object_defs))
+        for row_key, row_idx, row_values in rows
+    ]
+
+
+def merge_workbooks(excel_filepaths: List[str], output_filepath: str,
+                    sheet_names: Optional[List[str]] = None,
+                    keys: Optional[Set[str]] = None,
+                    merge: bool = False,
+                    max_workers: Optional[int] = None) -> List[str]:
+    """
+    複数のワークブックを並列に変換し、同名のシートを1つのmapブロックにまとめる。
+    
+    引数:
+        excel_filepaths: Excelファイルのパスのリスト
+        output_filepath: 出力するtfvarsファイルのパス、またはテキストストリーム
+        sheet_names: 変換するシート名のリスト（省略時は3_SHEET_NAME_PREFIXESで判定）
+        keys: 変換するキーの集合（オプション）
+        merge: Trueの場合は既存の出力ファイルにマージし、Falseの場合は上書きする
+            （ストリームの場合は無視する）
+        max_workers: ワーカープロセス数（省略時はCPU数）
+        
+    戻り値:
+        キーの重複を表すメッセージのリスト。重複がある場合は何も出力しない
+        
+    例外:
+        ValueError: 指定したシートがどのワークブックにも存在しない場合
+    """
+    tasks: List[Tuple[str, str]] = []
+    for excel_filepath in excel_filepaths:
+        wb = openpyxl.load_workbook(excel_filepath, read_only=True)
+        available = wb.sheetnames
+        wb.close()
+        if sheet_names:
+            selected = [name for name in sheet_names if name in available]
+        else:
+            selected = select_sheets(available)
+        tasks.extend((excel_filepath, name) for name in selected)
+    if sheet_names:
+        found = {name for _, name in tasks}
+        missing = [name for name in sheet_names if name not in found]
+        if missing:
+            raise ValueError(f"Sheets not found: {', '.join(missing)}")
+
+    # (シート名, キー)から最初に現れた(ワークブック, 行番号)への索引で重複を検出する
+    key_index: Dict[Tuple[str, str], Tuple[str, int]] = {}
+    conflicts: List[str] = []
+    sheet_entries: Dict[str, Dict[str, str]] = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            _render_sheet_rows,
+            [path for path, _ in tasks], [name for _, name in tasks],
+            [keys] * len(tasks)
+        )
+        for (excel_filepath, sheet_title), rendered in zip(tasks, results):
+            print(f"Converted {sheet_title} sheet of {excel_filepath}")
+            entries = sheet_entries.setdefault(sheet_title, {})
+            for row_key, row_idx, text in rendered:
+                first = key_index.setdefault(
+                    (sheet_title, row_key), (excel_filepath, row_idx)
+                )
+                if first != (excel_filepath, row_idx):
+                    conflicts.append(
+                        f"Duplicate key '{row_key}' in sheet '{sheet_title}': "
+                        f"{first[0]} row {first[1]} and "
+                        f"{excel_filepath} row {row_idx}"
+                    )
+                    continue
+                entries[row_key] = text
+    if conflicts:
+        return conflicts
+
+    if merge and not hasattr(output_filepath, "write"):
+        for sheet_title, entries in sheet_entries.items():
+            _merge_into_output(output_filepath, sheet_title, entries,
+                               replace_sheet=keys is None)
+        return conflicts
+    with contextlib.ExitStack() as stack:
+        if hasattr(output_filepath, "write"):
+            tfvars_file = output_filepath
+        else:
+            tfvars_file = stack.enter_context(
+                open(output_filepath, "w", encoding="utf-8", newline="\n")
+            )
+        for sheet_title, entries in sheet_entries.items():
+            tfvars_file.write(f"{sheet_title} = {{\n")
+            tfvars_file.writelines(entries.values())
+            tfvars_file.write("}\n")
+    return conflicts
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python 3_excel2map.py <excel_filepath>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Excel(2次元表)からmap形式のterraform.tfvarsを生成する"
+    )
+    parser.add_argument(
+        "excel_filepath", nargs="+",
+        help="Excelファイルのパス（-で標準入力）。複数指定した場合は同名のシートを1つのmapにまとめる"
+    )
+    parser.add_argument(
+        "--profile-memory", action="store_true",
+        help="シート・フェーズごとのメモリ使用量をmemory_profile.jsonに出力する"
+    )
+    parser.add_argument(
+        "--sheets",
+        help="変換するシート名（カンマ区切り）。指定時は3_SHEET_NAME_PREFIXESより優先する"
+    )
+    parser.add_argument(
+        "--keys", help="変換するキー（カンマ区切り）。既存の出力ファイルの該当エントリを置き換える"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="出力するtfvarsファイルのパス（-で標準出力、標準入力から読む場合の既定）"
+    )
+    parser.add_argument(
+        "--output-name", default="merged",
+        help="複数のExcelファイルを指定した場合の出力フォルダ名（既定: merged）"
+    )
+    parser.add_argument(
+        "--jobs", type=int, help="複数のExcelファイルを変換するプロセス数（既定: CPU数）"
+    )
+    parser.add_argument(
+        "--row-jobs", type=int,
+        help="1シートのデータ行をチャンクに分けて並列に変換するプロセス数"
+    )
+    parser.add_argument(
+        "--chunk-size", type=int,
+        help=f"--row-jobs指定時の1チャンクあたりの行数（既定: {DEFAULT_CHUNK_SIZE}）"
+    )
+    args = parser.parse_args()
 
-    excel_file_path = sys.argv[1]
+    excel_file_paths = args.excel_filepath
+    selected_sheet_names = (
+        [name.strip() for name in args.sheets.split(",")] if args.sheets else None
+    )
+    selected_keys = (
+        {key.strip() for key in args.keys.split(",")} if args.keys else None
+    )
+    # シート・キーを指定した部分変換は既存の出力ファイルにマージする
+    merge = bool(args.sheets or args.keys)
+
+    if "-" in excel_file_paths and len(excel_file_paths) > 1:
+        print("Standard input cannot be combined with other Excel files")
+        sys.exit(1)
 
     # 出力ディレクトリ構造の作成
-    excel_file_name = os.path.splitext(os.path.basename(excel_file_path))[0]
-    output_folder = os.path.join("output", excel_file_name)
-    os.makedirs(output_folder, exist_ok=True)
-    output_tfvars_file = os.path.join(output_folder, "terraform.tfvars")
+    if args.output:
+        output_tfvars_file = args.output
+    elif excel_file_paths == ["-"]:
+        output_tfvars_file = "-"
+    else:
+        if len(excel_file_paths) > 1:
+            output_folder = os.path.join("output", args.output_name)
+        else:
+            excel_file_name = os.path.splitext(os.path.basename(excel_file_paths[0]))[0]
+            output_folder = os.path.join("output", excel_file_name)
+        os.makedirs(output_folder, exist_ok=True)
+        output_tfvars_file = os.path.join(output_folder, "terraform.tfvars")
 
-    # 設定されたプレフィックスに一致するシートを処理
-    wb = openpyxl.load_workbook(excel_file_path)
-    for sheet_name in wb.sheetnames:
-        if any(sheet_name.startswith(prefix) for prefix in SHEET_PREFIXES):
+    # 標準出力に書き出す場合、変換結果はバッファに溜め、メッセージは標準エラー出力へ回す
+    to_stdout = output_tfvars_file == "-"
+    output_target = io.StringIO() if to_stdout else output_tfvars_file
+    redirect = (
+        contextlib.redirect_stdout(sys.stderr) if to_stdout
+        else contextlib.nullcontext()
+    )
+
+    if len(excel_file_paths) > 1:
+        # 複数ファイルはファイル単位で並列に変換するため、行単位の並列化は使えない
+        for option, value in (("--profile-memory", args.profile_memory),
+                              ("--row-jobs", args.row_jobs),
+                              ("--chunk-size", args.chunk_size)):
+            if value:
+                print(f"{option} cannot be used with multiple Excel files")
+                sys.exit(1)
+        with redirect:
+            try:
+                conflicts = merge_workbooks(
+                    excel_file_paths, output_target, selected_sheet_names,
+                    selected_keys, merge, args.jobs
+                )
+            except ValueError as e:
+                print(e)
+                sys.exit(1)
+            if conflicts:
+                print("-----duplicate keys:")
+                for conflict in conflicts:
+                    print(conflict)
+                sys.exit(1)
+        if to_stdout:
+            sys.stdout.buffer.write(output_target.getvalue().encode("utf-8"))
+        sys.exit(0)
+
+    excel_file_path = excel_file_paths[0]
+    source = (
+        io.BytesIO(sys.stdin.buffer.read()) if excel_file_path == "-"
+        else excel_file_path
+    )
+
+    if args.profile_memory and args.row_jobs:
+        print("--profile-memory cannot be used with --row-jobs")
+        sys.exit(1)
+    # 標準出力に書き出す場合、メモリプロファイルはカレントディレクトリに出力する
+    report_file = os.path.join(
+        "" if to_stdout else os.path.dirname(output_tfvars_file),
+        "memory_profile.json"
+    )
+    profiler = (
+        MemoryProfiler(report_filepath=report_file, excel_filepath=excel_file_path)
+        if args.profile_memory else None
+    )
+    if profiler:
+        profiler.start()
+
+    with redirect:
+        wb = openpyxl.load_workbook(source, read_only=True)
+        sheet_names = wb.sheetnames
+        wb.close()
+        try:
+            selected_sheets = select_sheets(sheet_names, selected_sheet_names)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+        for sheet_name in selected_sheets:
             print(f"Converting {sheet_name} sheet to terraform.tfvars")
-            excel_to_tfvars(excel_file_path, sheet_name, output_tfvars_file)
+            if args.row_jobs:
+                excel_to_tfvars_parallel(
+                    source, sheet_name, output_target, selected_keys, merge,
+                    args.row_jobs, args.chunk_size or DEFAULT_CHUNK_SIZE
+                )
+            else:
+                excel_to_tfvars(source, sheet_name, output_target,
+                                profiler, selected_keys, merge)
+
+        if profiler:
+            profiler.write_report(report_file, excel_file_path)
+            profiler.stop()
+            print(f"Memory profile written to {report_file}")
+
+    if to_stdout:
+        sys.stdout.buffer.write(output_target.getvalue().encode("utf-8"))
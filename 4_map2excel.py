@@ -0,0 +1,492 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+from dotenv import load_dotenv
+from openpyxl import Workbook
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# .envファイルを読み込む
+# 3_excel2map.pyと同じシート構造（データ開始行）で出力する
+load_dotenv()
+DATA_ROW_START = int(os.getenv("3_DATA_ROW_START", "6"))
+
+# tfvarsの字句定義（3_excel2map.pyが出力するHCLのサブセットに対応）
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>[ \t\r\n]+)
+  | (?P<comment>(?:\#|//)[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_-]*)
+  | (?P<punct>[{}\[\]=,:])
+""", re.VERBOSE)
+
+_OBJECT_TYPES = ["map(object)", "object", "list(object)"]
+# 3_excel2map.pyが同名の列への参照として扱うオブジェクト要素の型
+_REFERENCE_ELEM_TYPES = _OBJECT_TYPES + ["list", "list(cidr)"]
+
+
+def _tokenize(text: str) -> Iterator[Tuple[str, str, int]]:
+    """
+    tfvarsのテキストをトークンに分割する。
+
+    引数:
+        text: tfvarsファイルの内容
+
+    戻り値:
+        (種別, 値, 行番号)のタプルを返すイテレータ
+
+    例外:
+        ValueError: 解釈できない文字がある場合
+    """
+    pos = 0
+    line = 1
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            raise ValueError(
+                f"Error: unexpected character {text[pos]!r} at line {line}"
+            )
+        kind = match.lastgroup
+        value = match.group()
+        if kind not in ("ws", "comment"):
+            yield kind, value, line
+        line += value.count("\n")
+        pos = match.end()
+
+
+class _Parser:
+    """
+    map形式のtfvarsを解析する再帰下降パーサー。
+
+    大きなtfvarsでもトークンのリストを作らないよう、1トークンだけ先読みする。
+    """
+
+    def __init__(self, text: str) -> None:
+        self.tokens = _tokenize(text)
+        self.lookahead = next(self.tokens, None)
+
+    def _peek(self) -> Optional[Tuple[str, str, int]]:
+        return self.lookahead
+
+    def _next(self) -> Tuple[str, str, int]:
+        token = self.lookahead
+        if token is None:
+            raise ValueError("Error: unexpected end of tfvars")
+        self.lookahead = next(self.tokens, None)
+        return token
+
+    def _expect(self, value: str) -> None:
+        kind, actual, line = self._next()
+        if actual != value:
+            raise ValueError(
+                f"Error: expected '{value}' but got '{actual}' at line {line}"
+            )
+
+    def _skip_comma(self) -> None:
+        token = self._peek()
+        if token and token[1] == ",":
+            self._next()
+
+    def _key(self) -> str:
+        kind, value, line = self._next()
+        if kind == "string":
+            return json.loads(value)
+        if kind in ("ident", "number"):
+            return value
+        raise ValueError(f"Error: invalid key '{value}' at line {line}")
+
+    def parse_document(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        while self._peek() is not None:
+            name = self._key()
+            self._expect("=")
+            result[name] = self.parse_value()
+        return result
+
+    def parse_value(self) -> Any:
+        kind, value, line = self._next()
+        if kind == "string":
+            return json.loads(value)
+        if kind == "number":
+            return float(value) if any(c in value for c in ".eE") else int(value)
+        if kind == "ident":
+            if value in ("true", "false"):
+                return value == "true"
+            if value == "null":
+                return None
+            raise ValueError(f"Error: unsupported value '{value}' at line {line}")
+        if value == "[":
+            items = []
+            while self._peek() is not None and self._peek()[1] != "]":
+                items.append(self.parse_value())
+                self._skip_comma()
+            self._expect("]")
+            return items
+        if value == "{":
+            obj: Dict[str, Any] = {}
+            while self._peek() is not None and self._peek()[1] != "}":
+                key = self._key()
+                kind, sep, line = self._next()
+                if sep not in ("=", ":"):
+                    raise ValueError(
+                        f"Error: expected '=' but got '{sep}' at line {line}"
+                    )
+                obj[key] = self.parse_value()
+                self._skip_comma()
+            self._expect("}")
+            return obj
+        raise ValueError(f"Error: unexpected '{value}' at line {line}")
+
+
+def load_map_tfvars(filepath: str) -> Dict[str, Any]:
+    """
+    tfvarsファイルを読み込み、変数名から値へのマッピングを返す。
+
+    引数:
+        filepath: tfvarsファイルのパス
+
+    戻り値:
+        変数名から値（dict, list, str, int, float, bool, None）へのマッピング
+    """
+    with open(filepath, "r", encoding="utf-8") as f:
+        return parse_map_tfvars(f.read())
+
+
+def parse_map_tfvars(text: str) -> Dict[str, Any]:
+    """
+    tfvarsの文字列を解析し、変数名から値へのマッピングを返す。
+
+    引数:
+        text: tfvarsの内容
+
+    戻り値:
+        変数名から値（dict, list, str, int, float, bool, None）へのマッピング
+    """
+    return _Parser(text).parse_document()
+
+
+def _scalar_type(value: Any) -> Optional[str]:
+    # boolはintのサブクラスなので先に判定する
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return None
+
+
+def _value_type(value: Any) -> Optional[str]:
+    """
+    値の形から2次元表の列の型を推定する。空の値の場合はNoneを返す。
+    """
+    if value is None or value == {} or value == []:
+        return None
+    scalar = _scalar_type(value)
+    if scalar:
+        return scalar
+    if isinstance(value, list):
+        if all(isinstance(v, dict) for v in value):
+            return "list(object)"
+        return "list"
+    if isinstance(value, dict):
+        if all(isinstance(v, dict) for v in value.values()):
+            return "map(object)"
+        return "object"
+    return None
+
+
+def _map_key_prefix(keys: List[str], field: str, key: str) -> str:
+    """
+    "rule01", "rule02"のようなキーから接頭辞"rule"を取り出す。
+
+    例外:
+        ValueError: キーが3_excel2map.pyの生成する'接頭辞01'からの連番と
+            一致しない場合（シート経由では元のキーを復元できないため）
+    """
+    match = re.match(r"^(.*?)\d{2,}$", keys[0]) if keys else None
+    prefix = match.group(1) if match and match.group(1) else field
+    expected = [f"{prefix}{i:02d}" for i in range(1, len(keys) + 1)]
+    if keys != expected:
+        raise ValueError(
+            f"Error: map keys of '{field}' in key '{key}' "
+            f"({', '.join(keys)}) are not the sequence "
+            f"{prefix}01..{expected[-1]} and would be renamed in the sheet"
+        )
+    return prefix
+
+
+def _infer_schema(entries: Dict[str, Dict[str, Any]]
+                  ) -> Tuple[List[str], Dict[str, str], Dict[str, Dict[str, str]],
+                             Dict[str, str]]:
+    """
+    シートのヘッダー・型・オブジェクト定義を全エントリから推定する。
+
+    引数:
+        entries: キーから各フィールドの値へのマッピング
+
+    戻り値:
+        以下を含むタプル:
+        - fields: 列ヘッダー（先頭のキー列を除く）のリスト
+        - field_types: ヘッダーから型へのマッピング
+        - object_defs: ヘッダーからオブジェクト定義（要素名→要素型）へのマッピング
+        - map_key_prefixes: map(object)列のキー接頭辞
+
+    例外:
+        ValueError: 同じ列で型が一致しない場合、またはmap(object)のキーや
+            要素名がシートで表現できない場合（リスト型の要素と同名の列を含む）
+    """
+    fields: List[str] = []
+    field_types: Dict[str, str] = {}
+    object_defs: Dict[str, Dict[str, str]] = {}
+    map_key_prefixes: Dict[str, str] = {}
+
+    for key, data in entries.items():
+        for field, value in data.items():
+            if field not in fields:
+                fields.append(field)
+            typ = _value_type(value)
+            if typ is None:
+                continue
+            known = field_types.get(field)
+            if known is None:
+                field_types[field] = typ
+            elif known != typ:
+                raise ValueError(
+                    f"Error: field '{field}' has type '{known}' but key "
+                    f"'{key}' has '{typ}'"
+                )
+
+            if typ not in _OBJECT_TYPES:
+                continue
+            if typ == "object":
+                objects = [value]
+            elif typ == "list(object)":
+                objects = value
+            else:
+                objects = list(value.values())
+                prefix = _map_key_prefix(list(value.keys()), field, key)
+                known_prefix = map_key_prefixes.setdefault(field, prefix)
+                if known_prefix != prefix:
+                    raise ValueError(
+                        f"Error: map keys of '{field}' use prefix "
+                        f"'{known_prefix}' but key '{key}' uses '{prefix}'; "
+                        "a sheet column can hold only one prefix"
+                    )
+            object_def = object_defs.setdefault(field, {})
+            for obj in objects:
+                for elem, elem_value in obj.items():
+                    # map(object)の定義の先頭の'key'はキー接頭辞に使うため要素名にできない
+                    if typ == "map(object)" and elem == "key":
+                        raise ValueError(
+                            f"Error: element 'key' of '{field}' in key '{key}' "
+                            "conflicts with the map(object) key definition"
+                        )
+                    if isinstance(elem_value, list):
+                        elem_type = "list"
+                    else:
+                        elem_type = _scalar_type(elem_value)
+                    if elem_type is None and elem_value is not None:
+                        raise ValueError(
+                            f"Error: nested value '{field}.{elem}' of key '{key}' "
+                            "cannot be represented in a colon separated cell"
+                        )
+                    if elem_type is not None or elem not in object_def:
+                        object_def[elem] = elem_type or object_def.get(elem)
+
+    # 空の値しかない列は文字列型として扱う
+    for field in fields:
+        field_types.setdefault(field, "string")
+    for field, object_def in object_defs.items():
+        for elem, elem_type in object_def.items():
+            object_def[elem] = elem_type or "string"
+            # 3_excel2map.pyはリスト型の要素と同名の列を参照として要素に結合するため、
+            # 同名の列があるとその列が消え、要素の値も変わってしまう
+            if object_def[elem] in _REFERENCE_ELEM_TYPES and elem in fields:
+                raise ValueError(
+                    f"Error: element '{field}.{elem}' of type "
+                    f"'{object_def[elem]}' has the same name as field '{elem}' "
+                    "and would be merged with it by 3_excel2map.py"
+                )
+    return fields, field_types, object_defs, map_key_prefixes
+
+
+def _format_object_line(obj: Dict[str, Any], elems: List[str],
+                        field: str, key: str) -> str:
+    """
+    1オブジェクトを'値1:値2:...'形式の1行に変換する。
+    """
+    parts = []
+    for elem in elems:
+        value = obj.get(elem)
+        if value is None:
+            text = ""
+        elif isinstance(value, list):
+            text = ",".join(_format_scalar(v) for v in value)
+        else:
+            text = _format_scalar(value)
+        if ":" in text or "\n" in text:
+            raise ValueError(
+                f"Error: value '{text}' of '{field}.{elem}' in key '{key}' "
+                "contains ':' or a newline and cannot be written to a cell"
+            )
+        parts.append(text)
+    return ":".join(parts)
+
+
+def _format_scalar(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _format_cell(value: Any, typ: str, field: str, key: str,
+                 object_def: Dict[str, str]) -> Any:
+    """
+    1フィールドの値を3_excel2map.pyが読み込めるセル値に変換する。
+    """
+    if value is None or value == {} or value == []:
+        return None
+    if typ == "bool":
+        return "true" if value else "false"
+    if typ in ["string", "number"]:
+        return value
+    if typ == "list":
+        return "\n".join(_format_scalar(v) for v in value)
+    elems = list(object_def.keys())
+    if typ == "object":
+        return _format_object_line(value, elems, field, key)
+    if typ == "list(object)":
+        objects = value
+    else:  # map(object)の先頭要素はキー定義なので値には含めない
+        objects = list(value.values())
+        elems = elems[1:]
+    return "\n".join(
+        _format_object_line(obj, elems, field, key) for obj in objects
+    )
+
+
+def _sheet_rows(entries: Dict[str, Dict[str, Any]]) -> Iterator[List[Any]]:
+    """
+    1シート分の行（ヘッダー行からデータ行まで）を順に生成する。
+
+    引数:
+        entries: キーから各フィールドの値へのマッピング
+
+    戻り値:
+        ワークシートに追記する行のイテレータ
+    """
+    fields, field_types, object_defs, map_key_prefixes = _infer_schema(entries)
+
+    # map(object)の定義の先頭には出力時のキー接頭辞を'key:接頭辞'として置く
+    for field, prefix in map_key_prefixes.items():
+        object_defs[field] = {"key": prefix, **object_defs[field]}
+
+    types = [field_types[f] for f in fields]
+    definitions: List[Optional[str]] = []
+    counts: List[Optional[int]] = []
+    for field, typ in zip(fields, types):
+        if typ in _OBJECT_TYPES:
+            object_def = object_defs.get(field, {})
+            definitions.append(
+                "\n".join(f"{elem}:{elem_type}" for elem, elem_type in object_def.items())
+            )
+            count = len(object_def) - 1 if typ == "map(object)" else len(object_def)
+            counts.append(count)
+        else:
+            definitions.append(None)
+            counts.append(None)
+
+    yield ["key"] + fields
+    yield ["string"] + types
+    yield [None] + definitions
+    yield [None] + counts
+    for _ in range(5, DATA_ROW_START):
+        yield []
+    for key, data in entries.items():
+        yield [key] + [
+            _format_cell(data.get(field), typ, field, key, object_defs.get(field, {}))
+            for field, typ in zip(fields, types)
+        ]
+
+
+def tfvars_to_excel(tfvars: Dict[str, Any], excel_filepath: Any,
+                    sheet_names: Optional[List[str]] = None) -> List[str]:
+    """
+    map形式のtfvarsから2次元表のExcelファイルを生成する。
+
+    引数:
+        tfvars: load_map_tfvarsで読み込んだ変数のマッピング
+        excel_filepath: 出力するExcelファイルのパス、またはバイナリストリーム
+        sheet_names: 出力する変数名のリスト（省略時はmap形式の変数すべて）
+
+    戻り値:
+        出力したシート名のリスト
+
+    注意:
+        メモリ使用量を抑えるためopenpyxlのwrite_onlyモードで書き出します。
+        オブジェクトの要素として扱えるのは文字列・数値・ブール値と
+        それらのリストのみです。
+    """
+    wb = Workbook(write_only=True)
+    written: List[str] = []
+    for name, value in tfvars.items():
+        if sheet_names is not None and name not in sheet_names:
+            continue
+        # キーごとにオブジェクトを持つmap形式の変数だけを対象とする
+        if not isinstance(value, dict) or not all(
+            isinstance(v, dict) for v in value.values()
+        ):
+            print(f"Skipping {name}: not a map of objects")
+            continue
+        print(f"Converting {name} to sheet")
+        ws = wb.create_sheet(title=name)
+        for row in _sheet_rows(value):
+            ws.append(row)
+        written.append(name)
+    if not written:
+        # 空のワークブックは保存できないため、ここで終了する
+        return written
+    wb.save(excel_filepath)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="map形式のterraform.tfvarsからExcel(2次元表)を生成する"
+    )
+    parser.add_argument("tfvars_filepath", help="tfvarsファイルのパス（-で標準入力）")
+    parser.add_argument("excel_filepath", help="出力するExcelファイルのパス（-で標準出力）")
+    parser.add_argument(
+        "--sheets", help="出力する変数名（カンマ区切り、省略時はすべて）"
+    )
+    args = parser.parse_args()
+
+    to_stdout = args.excel_filepath == "-"
+    if not to_stdout and not args.excel_filepath.endswith(".xlsx"):
+        print("Only .xlsx files are supported")
+        sys.exit(1)
+
+    sheet_names = args.sheets.split(",") if args.sheets else None
+
+    # 標準出力に書き出す場合、メッセージは標準エラー出力へ回す
+    output = io.BytesIO() if to_stdout else args.excel_filepath
+    with contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext():
+        try:
+            if args.tfvars_filepath == "-":
+                tfvars = parse_map_tfvars(sys.stdin.read())
+            else:
+                tfvars = load_map_tfvars(args.tfvars_filepath)
+            written = tfvars_to_excel(tfvars, output, sheet_names)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        if not written:
+            print("No map variables found in tfvars")
+            sys.exit(1)
+    if to_stdout:
+        sys.stdout.buffer.write(output.getvalue())
@@ -0,0 +1,404 @@
+import argparse
+import base64
+import binascii
+import collections
+import contextlib
+import importlib
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from dotenv import load_dotenv
+
+# .envはサーバー起動時に一度だけ読み込み、ワーカープロセスにも引き継ぐ
+load_dotenv()
+
+XLSX_CONTENT_TYPE = (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+)
+
+# X-Conversion-Logヘッダーの上限（http.clientは1行64KiB、curlは100KiBまで）
+MAX_LOG_HEADER_BYTES = 8 * 1024
+
+# ワーカープロセス内で読み込んだ変換スクリプト（起動時に一度だけimportする）
+_modules: Dict[str, Any] = {}
+
+
+def _init_worker() -> None:
+    """
+    ワーカープロセスの初期化時に変換スクリプトとopenpyxlを読み込む。
+    """
+    for name in ("1_excel2tfvars", "2_tfvars2excel", "3_excel2map"):
+        _modules[name] = importlib.import_module(name)
+
+
+def _run_excel2tfvars(workbook: bytes, params: Dict[str, List[str]]) -> bytes:
+    # 1_excel2tfvars.pyのconvert_excelをメモリ上で実行する
+    module = _modules["1_excel2tfvars"]
+    return module.convert_excel(workbook).encode("utf-8")
+
+
+def _run_excel2map(workbook: bytes, params: Dict[str, List[str]]) -> bytes:
+    # 3_excel2map.pyのconvert_workbookをメモリ上で実行する
+    module = _modules["3_excel2map"]
+    sheets = params.get("sheets", [""])[0]
+    keys = params.get("keys", [""])[0]
+    return module.convert_workbook(
+        workbook,
+        sheet_names=[s.strip() for s in sheets.split(",")] if sheets else None,
+        keys={k.strip() for k in keys.split(",")} if keys else None,
+    ).encode("utf-8")
+
+
+def _run_tfvars2excel(body: bytes, params: Dict[str, List[str]]) -> bytes:
+    # 2_tfvars2excel.pyのupdate_workbookをメモリ上で実行する
+    module = _modules["2_tfvars2excel"]
+    try:
+        payload = json.loads(body)
+        workbook = base64.b64decode(payload["workbook"], validate=True)
+        tfvars_text = payload["tfvars"]
+    except (ValueError, KeyError, TypeError, binascii.Error) as e:
+        raise ValueError(
+            "Request body must be JSON with 'workbook' (base64) and 'tfvars'"
+        ) from e
+    return module.update_workbook(tfvars_text, workbook)
+
+
+# パスごとの処理関数と応答のContent-Type
+ENDPOINTS = {
+    "/excel2tfvars": (_run_excel2tfvars, "text/plain; charset=utf-8"),
+    "/excel2map": (_run_excel2map, "text/plain; charset=utf-8"),
+    "/tfvars2excel": (_run_tfvars2excel, XLSX_CONTENT_TYPE),
+}
+
+
+def _run_job(path: str, body: bytes,
+             params: Dict[str, List[str]]) -> Tuple[bool, bytes, List[str]]:
+    """
+    ワーカープロセスで1件の変換を実行する。
+
+    引数:
+        path: エンドポイントのパス
+        body: リクエストボディ
+        params: クエリパラメータ
+
+    戻り値:
+        (成功したか, 結果またはエラーメッセージ, 変換中の標準出力の行)のタプル
+
+    注意:
+        変換スクリプトは検証エラー時にメッセージを表示してsys.exitするため、
+        標準出力を取り込み、SystemExitもエラーとして扱います。
+    """
+    handler, _ = ENDPOINTS[path]
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            result = handler(body, params)
+    except (ValueError, KeyError, SystemExit) as e:
+        message = str(e) if not isinstance(e, SystemExit) else "Conversion failed"
+        return False, message.encode("utf-8"), log.getvalue().splitlines()
+    return True, result, log.getvalue().splitlines()
+
+
+def _log_header(log: List[str]) -> Tuple[str, int]:
+    """
+    変換ログをヘッダーに収まる長さのJSON配列にする。
+
+    引数:
+        log: 変換中の標準出力の行
+
+    戻り値:
+        (JSON配列の文字列, 省略した行数)のタプル
+    """
+    size = 2
+    for count, line in enumerate(log):
+        size += len(json.dumps(line)) + 2
+        if size > MAX_LOG_HEADER_BYTES:
+            return json.dumps(log[:count]), len(log) - count
+    return json.dumps(log), 0
+
+
+class Metrics:
+    """
+    エンドポイントごとのリクエスト数・エラー数・レイテンシを集計する。
+    """
+
+    def __init__(self, window: int = 1000) -> None:
+        self.window = window
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        self.pool_restarts = 0
+        self.counts: Dict[str, int] = collections.Counter()
+        self.errors: Dict[str, int] = collections.Counter()
+        self.latencies: Dict[str, Deque[float]] = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.window)
+        )
+
+    def record(self, path: str, elapsed: float, ok: bool) -> None:
+        with self.lock:
+            self.counts[path] += 1
+            if not ok:
+                self.errors[path] += 1
+            self.latencies[path].append(elapsed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            endpoints = {}
+            for path, count in self.counts.items():
+                samples = sorted(self.latencies[path])
+
+                def percentile(p: float) -> float:
+                    index = min(len(samples) - 1, int(round(p * (len(samples) - 1))))
+                    return round(samples[index] * 1000, 3)
+
+                endpoints[path] = {
+                    "requests": count,
+                    "errors": self.errors[path],
+                    "latency_ms": {
+                        "p50": percentile(0.5),
+                        "p95": percentile(0.95),
+                        "p99": percentile(0.99),
+                        "max": round(samples[-1] * 1000, 3),
+                    },
+                }
+            return {
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "pool_restarts": self.pool_restarts,
+                "endpoints": endpoints,
+            }
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """
+    変換リクエストを受け付け、ワーカープールで処理するHTTPハンドラー。
+    """
+
+    server_version = "tfvars2excel"
+
+    def address_string(self) -> str:
+        # Unixソケットではclient_addressが空文字列になる
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def _send(self, status: int, body: bytes, content_type: str,
+              headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: Dict[str, Any]) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8")
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            self._send_json(200, self.server.metrics.snapshot())
+        elif path == "/healthz":
+            # ワーカーが強制終了された（OOMなど）プールは作り直し、その旨を返す
+            pool = self.server.pool
+            broken = getattr(pool, "_broken", False)
+            if broken:
+                self.server.replace_pool(pool)
+                self._send_json(503, {"status": "restarting", "error": str(broken)})
+            else:
+                self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": f"Not found: {path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path not in ENDPOINTS:
+            self._send_json(404, {"error": f"Not found: {url.path}"})
+            return
+        length_header = self.headers.get("Content-Length")
+        if length_header is None:
+            self._send_json(411, {"error": "Content-Length is required"})
+            return
+        # 負の値ではrfile.read()がクライアントの切断まで待ち続けるため拒否する
+        try:
+            length = int(length_header)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {
+                "error": f"Invalid Content-Length: {length_header}"
+            })
+            return
+        if length > self.server.max_request_bytes:
+            self._send_json(413, {
+                "error": f"Request exceeds {self.server.max_request_bytes} bytes"
+            })
+            return
+        body = self.rfile.read(length)
+
+        # 同時実行数の上限を超えた場合は待たせずに拒否する
+        metrics = self.server.metrics
+        if not self.server.slots.acquire(blocking=False):
+            with metrics.lock:
+                metrics.rejected += 1
+            self._send_json(503, {"error": "Too many concurrent requests"})
+            return
+        with metrics.lock:
+            metrics.in_flight += 1
+        started = time.perf_counter()
+        pool = self.server.pool
+        status = 422
+        try:
+            ok, result, log = pool.submit(
+                _run_job, url.path, body, parse_qs(url.query)
+            ).result()
+        except BrokenProcessPool as e:
+            # ワーカーが強制終了された場合はプールを作り直し、再試行を促す
+            self.server.replace_pool(pool)
+            ok, result, log = False, f"Worker process terminated: {e}".encode("utf-8"), []
+            status = 503
+        except Exception as e:
+            ok, result, log = False, str(e).encode("utf-8"), []
+        finally:
+            with metrics.lock:
+                metrics.in_flight -= 1
+            self.server.slots.release()
+        elapsed = time.perf_counter() - started
+        metrics.record(url.path, elapsed, ok)
+
+        if not ok:
+            self._send_json(status, {"error": result.decode("utf-8"), "log": log})
+            return
+        _, content_type = ENDPOINTS[url.path]
+        # format=jsonでは結果と全ログをJSONでまとめて返す（xlsxはbase64）
+        if parse_qs(url.query).get("format", [""])[0] == "json":
+            self._send_json(200, {
+                "result": (
+                    base64.b64encode(result).decode("ascii")
+                    if content_type == XLSX_CONTENT_TYPE
+                    else result.decode("utf-8")
+                ),
+                "log": log,
+                "elapsed_ms": round(elapsed * 1000, 3),
+            })
+            return
+        # 変換中のメッセージ（tfvars only/excel onlyなど）はJSON配列で返す。
+        # 長すぎる場合は先頭だけを返し、省略した行数を別のヘッダーで示す
+        log_header, omitted = _log_header(log)
+        headers = {
+            "X-Conversion-Log": log_header,
+            "X-Conversion-Time-Ms": f"{elapsed * 1000:.3f}",
+        }
+        if omitted:
+            headers["X-Conversion-Log-Truncated"] = str(omitted)
+        self._send(200, result, content_type, headers)
+
+
+class _ServerMixin:
+    """
+    ワーカープール・同時実行数・メトリクスをサーバーに持たせる。
+    """
+
+    daemon_threads = True
+
+    def setup_pool(self, workers: int, max_concurrency: int,
+                   max_request_bytes: int) -> None:
+        self.workers = workers
+        self.pool_lock = threading.Lock()
+        self.pool = ProcessPoolExecutor(max_workers=workers,
+                                        initializer=_init_worker)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_request_bytes = max_request_bytes
+        self.metrics = Metrics()
+
+    def replace_pool(self, broken_pool: ProcessPoolExecutor) -> None:
+        """
+        使用できなくなったワーカープールを新しいプールに置き換える。
+
+        引数:
+            broken_pool: 失敗したリクエストが使っていたプール
+
+        注意:
+            同じプールで失敗した複数のリクエストから呼ばれても、
+            置き換えは1回だけ行います。
+        """
+        with self.pool_lock:
+            if self.pool is not broken_pool:
+                return
+            self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                            initializer=_init_worker)
+        broken_pool.shutdown(wait=False, cancel_futures=True)
+        with self.metrics.lock:
+            self.metrics.pool_restarts += 1
+
+
+class ThreadingConversionServer(_ServerMixin, socketserver.ThreadingMixIn,
+                                HTTPServer):
+    pass
+
+
+if hasattr(socket, "AF_UNIX"):
+    class UnixConversionServer(_ServerMixin, socketserver.ThreadingMixIn,
+                               socketserver.UnixStreamServer):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="変換スクリプトを常駐させるローカル変換サーバー"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", help="TCPの代わりに待ち受けるUnixソケットのパス")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="ワーカープロセス数")
+    parser.add_argument("--max-concurrency", type=int,
+                        help="同時に処理するリクエスト数の上限（既定: ワーカー数の2倍）")
+    parser.add_argument("--max-request-bytes", type=int, default=50 * 1024 * 1024,
+                        help="リクエストボディの最大サイズ")
+    args = parser.parse_args()
+
+    if args.unix_socket:
+        if not hasattr(socket, "AF_UNIX"):
+            print("Unix sockets are not supported on this platform")
+            sys.exit(1)
+        # 前回のソケットファイルだけを削除し、それ以外のファイルは消さない
+        if os.path.lexists(args.unix_socket):
+            if not stat.S_ISSOCK(os.lstat(args.unix_socket).st_mode):
+                print(f"{args.unix_socket} exists and is not a socket")
+                sys.exit(1)
+            os.remove(args.unix_socket)
+        server = UnixConversionServer(args.unix_socket, ConversionHandler)
+        address = args.unix_socket
+    else:
+        server = ThreadingConversionServer((args.host, args.port), ConversionHandler)
+        address = f"http://{args.host}:{args.port}"
+    server.setup_pool(args.workers, args.max_concurrency or args.workers * 2,
+                      args.max_request_bytes)
+
+    # 最初のリクエストを待たずにワーカーを起動し、importを済ませておく
+    for future in [server.pool.submit(time.sleep, 0) for _ in range(args.workers)]:
+        future.result()
+
+    print(f"Serving on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.shutdown()
@@ -0,0 +1,96 @@
+from typing import (Any, Callable, Hashable, Iterable, Iterator, List,
+                    Optional, Sequence, Tuple)
+
+# 列全体や行範囲に書式を設定したシートでは、max_row/max_column（シートの
+# dimension）が実際のデータ範囲より大きくなるため、実データの範囲を求める
+
+
+def _is_empty(value: Any) -> bool:
+    # セルオブジェクトの場合は値で判定する
+    value = getattr(value, "value", value)
+    return value is None or value == ""
+
+
+def last_non_empty_column(row: Sequence[Any]) -> int:
+    """
+    行を末尾から走査し、最後の空でない列の番号を返す。
+
+    引数:
+        row: セル値（またはセル）のシーケンス
+
+    戻り値:
+        1始まりの列番号（すべて空の場合は0）
+    """
+    for col in range(len(row), 0, -1):
+        if not _is_empty(row[col - 1]):
+            return col
+    return 0
+
+
+def last_data_row(ws: Any, min_row: int, max_col: int) -> int:
+    """
+    通常モードのワークシートで、max_rowから後方に走査して最後の空でない行番号を返す。
+
+    引数:
+        ws: openpyxlワークシートオブジェクト（read_onlyモード以外）
+        min_row: データの開始行
+        max_col: 判定に使う最終列
+
+    戻り値:
+        最後の空でない行番号（データがない場合はmin_row - 1）
+
+    注意:
+        ws.cell()は存在しないセルを作成してしまうため、作成済みのセルだけを参照します。
+    """
+    cells = ws._cells
+    for row in range(ws.max_row, min_row - 1, -1):
+        for col in range(1, max_col + 1):
+            cell = cells.get((row, col))
+            if cell is not None and not _is_empty(cell.value):
+                return row
+    return min_row - 1
+
+
+def iter_until_trailing_blanks(rows: Iterable[Sequence[Any]], min_row: int,
+                               blank_key: Optional[Callable[[Sequence[Any]], Hashable]] = None
+                               ) -> Iterator[Tuple[int, Sequence[Any]]]:
+    """
+    行を順に返し、末尾の空行（書式だけが設定された行など）は返さない。
+
+    引数:
+        rows: ws.iter_rows()が返す行のイテレータ（値・セルのどちらでも可）
+        min_row: 最初の行の行番号
+        blank_key: 空行を区別するキーを返す関数（オプション）。キーが同じ
+            連続した空行は、最初の1行を代わりに返す。省略時は行の値そのものを
+            キーにする（values_only=Trueの行向け。セルの行では必ず指定する）
+
+    戻り値:
+        (行番号, 行)のタプルを返すイテレータ
+
+    注意:
+        read_onlyモードのシートは後方から読めないため、空行はその後に
+        空でない行が現れた時点でまとめて返します。途中の空行は従来どおり
+        呼び出し側に渡されます。
+        数十万行の書式だけの空行が続いてもメモリを使わないよう、空行は
+        (キー, 最初の行, 行数)の連続区間としてだけ保持します。
+    """
+    pending: List[List[Any]] = []
+    blank_start = min_row
+    for row_idx, row in enumerate(rows, start=min_row):
+        if all(_is_empty(value) for value in row):
+            key = blank_key(row) if blank_key is not None else tuple(row)
+            if not pending:
+                blank_start = row_idx
+            if pending and pending[-1][0] == key:
+                pending[-1][2] += 1
+            else:
+                pending.append([key, row, 1])
+            continue
+        if pending:
+            blank_idx = blank_start
+            for _, blank_row, count in pending:
+                for _ in range(count):
+                    yield blank_idx, blank_row
+                    blank_idx += 1
+            pending.clear()
+        yield row_idx, row